@@ -13,22 +13,30 @@ Features:
 
 import os
 import sys
+import atexit
+import functools
+import hashlib
+import heapq
 import json
 import logging
+import logging.handlers
+import queue
 import re
 import signal
 import threading
 import time
-import traceback
+import warnings
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
 import joblib
 import mysql.connector
-import pandas as pd
+import numpy as np
+import orjson
 import paho.mqtt.client as mqtt
-import paho.mqtt.publish as publish
-import paho.mqtt.subscribe as subscribe
 
 import asyncio
 from aiocoap import Message, Context
@@ -42,11 +50,9 @@ except ImportError:
     REQUESTS_AVAILABLE = False
     print("⚠️ requests module not available - border router discovery disabled")
 
-from flask import Flask, jsonify, request
-
-import asyncio
-from aiocoap import Message, Context
-from aiocoap.numbers import PUT
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException
 
 # Configuration
 MQTT_BROKER = os.environ.get("MQTT_BROKER", "iot_mosquitto")
@@ -56,18 +62,70 @@ MYSQL_HOST = os.environ.get("MYSQL_HOST", "iot_mysql")
 MYSQL_USER = os.environ.get("MYSQL_USER", "iotuser")
 MYSQL_PASSWORD = os.environ.get("MYSQL_PASSWORD", "iotpass")
 MYSQL_DB = os.environ.get("MYSQL_DB", "iotdb")
+MYSQL_POOL_SIZE = int(os.environ.get("MYSQL_POOL_SIZE", 25))
+
+# MySQL client errors meaning the server side of a pooled connection went away
+# (CR_SERVER_GONE_ERROR, CR_SERVER_LOST)
+LOST_CONNECTION_ERRNOS = (2006, 2013)
+
+# How long a checkout waits for a connection to be returned when every pooled one is in use
+DB_POOL_WAIT_SECONDS = 5.0
+
+# /api/health reports the database as connected without a checkout if an operation
+# succeeded within this many seconds
+DB_HEALTHY_WITHIN_SECONDS = 60
+
+# Sensor readings are queued and written in batches by a background thread
+SENSOR_QUEUE_SIZE = int(os.environ.get("SENSOR_QUEUE_SIZE", 10_000))
+SENSOR_BATCH_SIZE = int(os.environ.get("SENSOR_BATCH_SIZE", 500))
+SENSOR_FLUSH_INTERVAL = float(os.environ.get("SENSOR_FLUSH_INTERVAL", 0.2))  # seconds a partial batch may wait before being written
+
+# The in-memory energy stats are re-read from MySQL when older than this, picking up
+# changes made outside this process (other workers, manual edits)
+STATS_CACHE_TTL = 30.0
+
+# MQTT client flow-control limits
+MQTT_MAX_INFLIGHT = 200
+MQTT_MAX_QUEUED = 10_000
+
+# Device schedules are re-read from MySQL at most this often (seconds); saves write through
+SCHEDULE_CACHE_TTL = 300
+
+# Schedules are re-sent to each device this often (seconds); failed broadcasts are retried
+# after SCHEDULE_BROADCAST_RETRY. The broadcaster checks for due devices every SCHEDULE_BROADCAST_TICK
+SCHEDULE_BROADCAST_INTERVAL = 300
+SCHEDULE_BROADCAST_RETRY = 60
+SCHEDULE_BROADCAST_TICK = 5
+# Stored schedules missing from the broadcast heap are merged in from MySQL this often (seconds)
+SCHEDULE_BROADCAST_RESEED_INTERVAL = 600
+
+# Seconds a discovery query waits for a neighbour's reply (aiocoap would otherwise keep
+# retransmitting to a dead neighbour for about 90 s)
+COAP_QUERY_TIMEOUT = 5.0
+
+# Seconds between sweeps that remove expired overrides
+OVERRIDE_SWEEP_INTERVAL = 5
+
+# Seconds between purges of stale border router mappings (DELETE uses idx_last_seen)
+MAPPING_CLEANUP_INTERVAL = 3600
 
 # Temperature prediction constants (matches node configuration)
 TEMP_HISTORY_SIZE = 48  # 48 readings = 24 hours at 30-min intervals
 
 # Configure logging - minimize HTTP logs, maximize error tracking
+# Request, MQTT and writer threads only enqueue records; a listener thread does the stdout writes
+log_stream_handler = logging.StreamHandler(sys.stdout)
+log_stream_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+log_queue = queue.Queue(-1)
+log_queue_handler = logging.handlers.QueueHandler(log_queue)
+log_queue_handler.setFormatter(logging.Formatter())  # Message (+ traceback) only; the stream handler adds the prefix
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
+    handlers=[log_queue_handler]
 )
+log_listener = logging.handlers.QueueListener(log_queue, log_stream_handler)
+log_listener.start()
+atexit.register(log_listener.stop)  # Write out records still queued at exit
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
@@ -76,46 +134,130 @@ logger = logging.getLogger(__name__)
 werkzeug_logger = logging.getLogger('werkzeug')
 werkzeug_logger.setLevel(logging.ERROR)  # Only show errors, not every HTTP request
 
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson. Dates and anything else orjson can't
+    encode natively go through Flask's default encoder, so responses keep the
+    same format as with the stdlib provider.
+    """
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    sort_keys = False  # Clients don't depend on key order; skip the sort
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option),
+            mimetype=self.mimetype
+        )
+
 # Create Flask app with minimal logging
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.logger.setLevel(logging.ERROR)  # Suppress Flask info logs
 
+# Polled read endpoints cache their serialized response for this long
+API_CACHE_TTL = 1.0
+# Most distinct (endpoint, parameters) responses kept; least recently used are evicted
+API_CACHE_MAX_ENTRIES = 64
+
 # Critical operation counter for monitoring
-critical_ops = {
+# Counter: operations without a seeded key (e.g. "coap_errors") start at 0 on first increment
+critical_ops = Counter({
     "db_errors": 0,
     "mqtt_errors": 0,
     "ml_errors": 0,
     "api_errors": 0,
+    "sensor_drops": 0,  # Oldest queued readings discarded because the DB write queue was full
     "total_restarts": 0
-}
+})
+
+# All CoAP traffic runs on one long-lived event loop, so a single aiocoap client
+# context (and its UDP socket) is reused instead of created and torn down per request
+_coap_loop = None
+_coap_loop_lock = threading.Lock()
+_coap_ctx = None
+_coap_ctx_lock = asyncio.Lock()
+
+def _get_coap_loop():
+    """Return the CoAP event loop, starting its thread on first use"""
+    global _coap_loop
+    with _coap_loop_lock:
+        if _coap_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="coap-loop", daemon=True).start()
+            _coap_loop = loop
+    return _coap_loop
+
+def run_coap(coro, timeout: Optional[float] = None):
+    """
+    Run a CoAP coroutine on the shared CoAP loop and block until it finishes.
+    Must not be called from the CoAP loop itself (it would wait on its own thread).
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_coap_loop()).result(timeout)
+
+def _log_coap_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("❌ Background CoAP request failed: %s", future.exception())
+
+def submit_coap(coro):
+    """Schedule a CoAP coroutine on the shared CoAP loop without waiting for it (fire-and-forget)"""
+    future = asyncio.run_coroutine_threadsafe(coro, _get_coap_loop())
+    future.add_done_callback(_log_coap_failure)
+    return future
+
+async def get_coap_context():
+    """Return the shared aiocoap client context, creating it on first use"""
+    global _coap_ctx
+    if _coap_ctx is None:
+        async with _coap_ctx_lock:
+            if _coap_ctx is None:
+                _coap_ctx = await Context.create_client_context(transports=['udp6'])
+    return _coap_ctx
+
+def shutdown_coap():
+    """Close the shared CoAP context and stop the CoAP loop"""
+    global _coap_ctx
+    loop = _coap_loop
+    if loop is None:
+        return
+    if _coap_ctx is not None:
+        try:
+            run_coap(_coap_ctx.shutdown(), timeout=5)
+        except Exception as e:
+            logger.warning("⚠️ CoAP context shutdown failed: %s", e)
+        _coap_ctx = None
+    loop.call_soon_threadsafe(loop.stop)
 
 async def send_coap_request(uri, payload):
     """Send CoAP PUT request to device"""
-    logger.info(f"📤 CoAP PUT to {uri}")
-    logger.info(f"   Payload length: {len(payload)} bytes")
-    logger.info(f"   Payload preview: {payload[:200]}...")  # Log first 200 chars
+    logger.debug("📤 CoAP PUT to %s", uri)
+    logger.debug("   Payload length: %d bytes", len(payload))
+    logger.debug("   Payload preview: %.200s", payload)
 
     request = Message(code=PUT, payload=payload.encode('utf-8'))
     request.set_request_uri(uri)
-    logger.info(f"   Creating CoAP context for UDP6 transport...")
-    protocol = await Context.create_client_context(transports=['udp6'])
+    protocol = await get_coap_context()
     try:
-        logger.info(f"   Sending CoAP request and waiting for response...")
         response = await asyncio.wait_for(protocol.request(request).response, timeout=10.0)
-        logger.info(f"📥 CoAP Response: {response.code}")
         response_payload = response.payload.decode('utf-8') if response.payload else ""
-        logger.info(f"   Response payload: {response_payload[:200]}")  # Log first 200 chars
+        logger.info("📥 CoAP PUT %s -> %s", uri, response.code)
+        logger.debug("   Response payload: %.200s", response_payload)
         return response_payload
     except asyncio.TimeoutError:
-        logger.error(f"❌ CoAP Timeout: No response from {uri} after 10 seconds")
+        logger.error("❌ CoAP Timeout: No response from %s after 10 seconds", uri)
         return None
     except Exception as e:
-        logger.error(f"❌ CoAP Error: {e}")
-        logger.error(f"   Exception type: {type(e).__name__}")
-        logger.error(f"   Stack trace: {traceback.format_exc()}")
+        logger.error("❌ CoAP Error: %s (%s)", e, type(e).__name__)
+        # An unreachable node fails every request the same way; the traceback only helps when debugging
+        logger.debug("   Stack trace:", exc_info=True)
         return None
-    finally:
-        await protocol.shutdown()
 
 async def sync_device_clock(device_id: str) -> bool:
     """
@@ -126,11 +268,12 @@ async def sync_device_clock(device_id: str) -> bool:
         # Get device URI, replacing /settings with /time_sync
         settings_uri = get_device_uri(device_id)
         if not settings_uri:
-            # Try to discover neighbors if URI not found
-            discover_border_router_neighbors()
+            # Try to discover neighbors if URI not found. Discovery blocks on CoAP queries
+            # itself, so it runs in a worker thread rather than on this (the CoAP) loop
+            await asyncio.get_running_loop().run_in_executor(None, discover_border_router_neighbors)
             settings_uri = get_device_uri(device_id)
             if not settings_uri:
-                logger.warning(f"⏰ Cannot sync {device_id}: no URI available after discovery")
+                logger.warning("⏰ Cannot sync %s: no URI available after discovery", device_id)
                 return False
 
         # Replace /settings with /time_sync
@@ -149,31 +292,60 @@ async def sync_device_clock(device_id: str) -> bool:
             "minute": minute
         })
 
-        logger.info(f"⏰ Syncing {device_id} to server time: Day {day_of_week}, {hour:02d}:{minute:02d}")
+        logger.debug("⏰ Syncing %s to server time: Day %d, %02d:%02d", device_id, day_of_week, hour, minute)
 
         # Send CoAP PUT request
         request = Message(code=PUT, payload=payload.encode('utf-8'))
         request.set_request_uri(time_sync_uri)
-        protocol = await Context.create_client_context(transports=['udp6'])
+        protocol = await get_coap_context()
 
         try:
             response = await protocol.request(request).response
             if response.code.is_successful():
-                logger.info(f"✅ Clock sync successful for {device_id}: {response.code}")
+                logger.info("✅ Clock sync successful for %s: %s", device_id, response.code)
                 return True
             else:
-                logger.warning(f"⚠️ Clock sync failed for {device_id}: {response.code}")
+                logger.warning("⚠️ Clock sync failed for %s: %s", device_id, response.code)
                 return False
         except Exception as e:
-            logger.error(f"❌ Clock sync error for {device_id}: {e}")
+            logger.error("❌ Clock sync error for %s: %s", device_id, e)
             return False
-        finally:
-            await protocol.shutdown()
 
     except Exception as e:
         log_critical_error("coap", e, f"Failed to sync clock for {device_id}")
         return False
 
+# Fields a node may report its identifier under, in order of preference. Replies can be
+# truncated or corrupted JSON, so the value is pulled out with a regex instead of parsed
+DEVICE_ID_FIELD_RES = tuple(
+    (field, re.compile(rf'"{field}"\s*:\s*"([^"]+)"'))
+    for field in ('device_id', 'id', 'node_id', 'name')
+)
+
+# Upper bound on CoAP exchanges in flight during a fan-out over all devices
+COAP_FANOUT_LIMIT = 32
+
+async def sync_all_devices(device_ids) -> Dict[str, bool]:
+    """
+    Synchronize the clocks of several devices concurrently over the shared CoAP context.
+    Returns {device_id: success}; an unresponsive node only delays its own result.
+    """
+    limit = asyncio.Semaphore(COAP_FANOUT_LIMIT)
+
+    async def sync_one(device_id):
+        async with limit:
+            return await asyncio.wait_for(sync_device_clock(device_id), timeout=10.0)
+
+    device_ids = list(device_ids)
+    results = await asyncio.gather(*(sync_one(d) for d in device_ids), return_exceptions=True)
+    outcome = {}
+    for device_id, result in zip(device_ids, results):
+        if isinstance(result, BaseException):
+            logger.error("⏰ Failed to sync %s: %r", device_id, result)
+            result = False
+        outcome[device_id] = result
+    return outcome
+
 async def query_device_id(ip_address: str) -> Optional[str]:
     """
     Query a device for its ID via CoAP GET request
@@ -182,123 +354,171 @@ async def query_device_id(ip_address: str) -> Optional[str]:
     uri = f"coap://[{ip_address}]/settings"
     request = Message(code=GET)
     request.set_request_uri(uri)
-    protocol = await Context.create_client_context(transports=['udp6'])
+    protocol = await get_coap_context()
     try:
-        response = await protocol.request(request).response
-        logger.debug(f"📡 CoAP response from {ip_address}: code={response.code}, payload_length={len(response.payload)}")
+        response = await asyncio.wait_for(protocol.request(request).response, timeout=COAP_QUERY_TIMEOUT)
+        logger.debug("📡 CoAP response from %s: code=%s, payload_length=%d", ip_address, response.code, len(response.payload))
 
         if response.code.is_successful():
             # Handle potentially truncated/corrupted JSON responses
             raw_payload = response.payload.decode('utf-8', errors='ignore')
-            logger.debug(f"📡 Raw payload from {ip_address}: {repr(raw_payload)}")
-
-            # Try to extract device_id using regex from the raw response
-            import re
-            device_id_match = re.search(r'"device_id"\s*:\s*"([^"]+)"', raw_payload)
-            if device_id_match:
-                device_id = device_id_match.group(1)
-                logger.info(f"📡 Queried {ip_address} -> device_id: {device_id}")
-                return device_id
-
-            # Fallback: try other possible field names
-            for field in ['id', 'node_id', 'name']:
-                match = re.search(rf'"{field}"\s*:\s*"([^"]+)"', raw_payload)
+            logger.debug("📡 Raw payload from %s: %.200r", ip_address, raw_payload)
+
+            # Extract the identifier with regexes from the raw response, preferring device_id
+            for field, field_re in DEVICE_ID_FIELD_RES:
+                match = field_re.search(raw_payload)
                 if match:
                     device_id = match.group(1)
-                    logger.info(f"📡 Queried {ip_address} -> {field}: {device_id}")
+                    logger.info("📡 Queried %s -> %s: %s", ip_address, field, device_id)
                     return device_id
 
-            logger.warning(f"⚠️ No device identifier found in response from {ip_address}")
+            logger.warning("⚠️ No device identifier found in response from %s", ip_address)
         else:
-            logger.warning(f"⚠️ CoAP query failed for {ip_address}: {response.code}")
+            logger.warning("⚠️ CoAP query failed for %s: %s", ip_address, response.code)
+    except asyncio.TimeoutError:
+        logger.warning("⚠️ CoAP query to %s timed out after %.0fs", ip_address, COAP_QUERY_TIMEOUT)
     except Exception as e:
-        logger.warning(f"⚠️ CoAP query error for {ip_address}: {e}")
-    finally:
-        await protocol.shutdown()
+        logger.warning("⚠️ CoAP query error for %s: %s", ip_address, e)
 
     return None
 
 def get_device_uri(device_id: str) -> Optional[str]:
     """
     Get CoAP URI for a device dynamically
-    Priority order: MQTT payload IP -> Border router discovery cache -> Hardcoded patterns
+    Priority order: MQTT payload IP -> Border router discovery cache (seeded from the
+    border_router_mappings table at startup). Returns None if the device is unknown,
+    so callers can trigger discovery instead of addressing a guessed IP.
     """
     # First priority: Check if URI is stored in latest sensor data (from MQTT payload)
-    if device_id in latest_sensor_data:
-        device_data = latest_sensor_data[device_id]
-        # Check if URI is stored in device data
-        if 'coap_uri' in device_data:
-            uri = device_data['coap_uri']
-            logger.debug(f"📡 Using MQTT-provided URI for {device_id}: {uri}")
-            return uri
+    device_data = latest_sensor_data.get(device_id)
+    if device_data is not None and 'coap_uri' in device_data:
+        uri = device_data['coap_uri']
+        logger.debug("📡 Using MQTT-provided URI for %s: %s", device_id, uri)
+        return uri
 
     # Second priority: Use cached border router neighbor mappings (DO NOT trigger discovery here!)
     # Discovery is only triggered periodically in background or on explicit request
-    if device_id in border_router_neighbors:
-        ip_addr = border_router_neighbors[device_id]
+    ip_addr = border_router_neighbors.get(device_id)
+    if ip_addr is not None:
         uri = f"coap://[{ip_addr}]/settings"
-        logger.debug(f"🌐 Using cached border router URI for {device_id}: {uri}")
+        logger.debug("🌐 Using cached border router URI for %s: %s", device_id, uri)
         return uri
 
-    # Third priority: Fallback to hardcoded patterns
-    # This assumes a standard IPv6 pattern for Contiki nodes
-    # In a production system, URIs would be stored in database during device registration
-    # border router shows data on http://[fd00::f6ce:365a:bb21:6e94], normally
-    uri_patterns = {
-        "node1": "coap://[fd00::f6ce:3686:4ff2:1a3]/settings",
-        "node2": "coap://[fd00::f6ce:3613:93ee:6aad]/settings",
-        "node3": "coap://[fd00::f6ce:3673:822d:d8c7]/settings",
-    }
+    logger.debug("❓ No known URI for %s", device_id)
+    return None
 
-    uri = uri_patterns.get(device_id)
-    if uri:
-        logger.debug(f"📋 Using hardcoded fallback URI for {device_id}: {uri}")
+def log_critical_error(operation: str, error: Exception, context: str = "", *context_args):
+    """
+    Log critical errors that might cause crashes.
+    context may hold %-style placeholders filled from context_args when the record is emitted.
+    """
+    key = f"{operation}_errors"
+    critical_ops[key] += 1
+    count = critical_ops[key]
+    logger.error("💥 CRITICAL %s ERROR: %s", operation.upper(), error)
+    if context:
+        if context_args:
+            logger.error("   📍 Context: " + context, *context_args)
+        else:
+            logger.error("   📍 Context: %s", context)
+    logger.error("   📊 Error count for %s: %d", operation, count)
 
-    return uri
+    # Stack trace only at DEBUG - formatting it on every repeated failure is the expensive part
+    logger.debug("   📚 Stack trace:", exc_info=error)
 
-def log_critical_error(operation: str, error: Exception, context: str = ""):
-    """Log critical errors that might cause crashes"""
-    critical_ops[f"{operation}_errors"] = critical_ops.get(f"{operation}_errors", 0) + 1
-    logger.error(f"💥 CRITICAL {operation.upper()} ERROR: {error}")
-    if context:
-        logger.error(f"   📍 Context: {context}")
-    logger.error(f"   📊 Error count for {operation}: {critical_ops.get(f'{operation}_errors', 0)}")
+# Set once shutdown has started, so repeated signals/hooks only shut down once
+shutdown_event = threading.Event()
 
-    # Log stack trace for debugging
-    import traceback
-    logger.error(f"   📚 Stack trace:\n{traceback.format_exc()}")
+def shutdown_background_services():
+    """Stop MQTT intake and flush work still buffered in memory before the process exits"""
+    if shutdown_event.is_set():
+        return
+    shutdown_event.set()
+
+    # Stop taking new readings first, then send a clean DISCONNECT so the broker drops the session now
+    client = globals().get('mqtt_client')
+    if client is not None:
+        try:
+            client.disconnect()
+            client.loop_stop()
+        except Exception as e:
+            logger.warning("⚠️ MQTT disconnect on shutdown failed: %s", e)
+
+    # Don't lose override writes or readings still waiting to be written.
+    # Override writes are only queued under override_expiry_lock and skipped once shutdown_event
+    # is set, so nothing can be submitted after the executor closes
+    if 'override_db_executor' in globals():
+        with override_expiry_lock:
+            override_db_executor.shutdown(wait=False)
+        override_db_executor.shutdown(wait=True)
+    shutdown_coap()
+    if 'db' in globals():
+        # Let the writer finish its in-flight batch, then write whatever is left in the queue
+        db.stop_writer()
+        db.flush_sensor_data()
+        db.close()
 
 def signal_handler(signum, frame):
     """Handle shutdown signals gracefully"""
-    logger.warning(f"🔄 Received signal {signum}, shutting down gracefully...")
+    logger.warning("🔄 Received signal %s, shutting down gracefully...", signum)
     critical_ops["total_restarts"] += 1
-    logger.info(f"📊 Total restarts: {critical_ops['total_restarts']}")
+    logger.info("📊 Total restarts: %d", critical_ops['total_restarts'])
+    shutdown_background_services()
     sys.exit(0)
 
-# Register signal handlers
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGINT, signal_handler)
-
 # Global state management
-device_overrides = {}  # {device_id: {status, expires_at, type}}
+# These dicts are shared between the MQTT thread and Flask request threads without a lock.
+# Single-key assignment, get() and pop() are atomic under the GIL, so the invariant is:
+# never mutate a value dict in place - build a new dict and assign it to the key.
+# Iterate over a list(...) snapshot, never over the live view.
+device_overrides = {}  # {device_id: {status, expires_at, expires_at_ts, type}}
 latest_sensor_data = {}  # {device_id: latest_data}
 last_device_states = {}  # {device_id: last_led_command} - Track actual state changes
 
+# Min-heap of (expires_at_ts, device_id) for timed overrides, swept by periodic_override_sweep.
+# Entries for overrides that were replaced or removed are skipped when popped.
+override_expiry_heap = []
+
+# Guards override_expiry_heap and every write to device_overrides, together with queueing
+# the matching database write, so the override-db queue runs in the same order as memory changed
+override_expiry_lock = threading.Lock()
+
+# Min-heap of (due_at, device_id) on time.monotonic() for schedule broadcasts, drained by
+# periodic_schedule_broadcast. schedule_broadcast_due holds each device's current due time;
+# heap entries that don't match it were superseded and are skipped when popped.
+schedule_broadcast_heap = []
+schedule_broadcast_due = {}
+schedule_broadcast_lock = threading.Lock()
+
 class DatabaseManager:
     def __init__(self):
         self.pool = None
         self.connection_attempts = 0
         self.max_retries = 5
+        self._write_q = queue.Queue(maxsize=SENSOR_QUEUE_SIZE)
+        self.last_success = 0.0  # time.monotonic() of the last successful database operation
+        self._stats_lock = threading.Lock()
+        self._stats_cache = None  # In-memory snapshot of the energy_stats row
+        self._stats_cache_ts = 0.0  # time.monotonic() when the snapshot was last read from MySQL
+        self._schedule_lock = threading.Lock()
+        self._schedule_cache = {}  # {device_id: (expires_at, schedule)} - see load_device_schedule
         self.connect()
+        if self.pool:
+            self._refresh_energy_stats()
+        self._writer_thread = threading.Thread(target=self._sensor_writer_loop, name="sensor-writer", daemon=True)
+        self._writer_thread.start()
 
     def connect(self):
         """Create a connection pool with retry logic"""
+        logger.info("🔗 Creating database connection pool for %s:%s (pool_size=%d)", MYSQL_HOST, MYSQL_DB, MYSQL_POOL_SIZE)
         while self.connection_attempts < self.max_retries:
             try:
-                logger.info(f"🔗 Creating database connection pool for {MYSQL_HOST}:{MYSQL_DB} (attempt {self.connection_attempts + 1})")
                 self.pool = mysql.connector.pooling.MySQLConnectionPool(
                     pool_name="iot_pool",
-                    pool_size=10,
+                    pool_size=MYSQL_POOL_SIZE,
+                    # Connections go straight back into the queue on close(); a session
+                    # reset would cost an extra COM_RESET_CONNECTION round-trip per checkout
+                    pool_reset_session=False,
                     host=MYSQL_HOST,
                     user=MYSQL_USER,
                     password=MYSQL_PASSWORD,
@@ -309,12 +529,18 @@ class DatabaseManager:
                     raise_on_warnings=False,
                     sql_mode='',
                     use_unicode=True,
-                    charset='utf8mb4'
+                    charset='utf8mb4',
+                    # Use the C extension (libmysqlclient) for protocol and row decoding; this is
+                    # the default when it is installed, but make it explicit
+                    use_pure=False
                 )
-                # Test the pool by getting a connection
-                conn = self.pool.get_connection()
-                conn.close()
-                logger.info("✅ Database connection pool created successfully.")
+                # The pool opens all pool_size connections up front, so getting here means MySQL
+                # is reachable; no separate test checkout needed. Connections that die later are
+                # reconnected on checkout (see connection()), so the pool is never rebuilt for that
+                logger.info("✅ Database connection pool created successfully (%s driver).",
+                            "C extension" if mysql.connector.HAVE_CEXT else "pure Python")
+                if not mysql.connector.HAVE_CEXT:
+                    logger.warning("⚠️ mysql-connector C extension not available - database access is slower")
                 self._create_tables()
                 return
             except mysql.connector.Error as e:
@@ -330,6 +556,16 @@ class DatabaseManager:
                 self.pool = None
                 break
 
+    def close(self):
+        """Disconnect the idle pooled connections instead of leaving MySQL to time them out"""
+        if not self.pool:
+            return
+        try:
+            # mysql-connector has no public pool close; this drains the queue and disconnects each
+            self.pool._remove_connections()
+        except Exception as e:
+            logger.warning("⚠️ Failed to close database pool connections: %s", e)
+
     def get_connection(self):
         """Get a connection from the pool"""
         if not self.pool:
@@ -341,6 +577,18 @@ class DatabaseManager:
 
         try:
             return self.pool.get_connection()
+        except mysql.connector.errors.PoolError:
+            # Pool exhausted, not broken: wait for a connection to come back instead of rebuilding it
+            deadline = time.monotonic() + DB_POOL_WAIT_SECONDS
+            while True:
+                time.sleep(0.01)
+                try:
+                    return self.pool.get_connection()
+                except mysql.connector.errors.PoolError:
+                    if time.monotonic() >= deadline:
+                        logger.error("❌ Database pool exhausted: no connection free after %.0fs (pool_size=%d)",
+                                     DB_POOL_WAIT_SECONDS, MYSQL_POOL_SIZE)
+                        raise
         except mysql.connector.Error as e:
             log_critical_error("db", e, "Failed to get connection from pool")
             # If pool is broken, try to re-establish it
@@ -349,12 +597,58 @@ class DatabaseManager:
                 return self.pool.get_connection()
             raise e
 
+    @contextmanager
+    def connection(self):
+        """
+        Check a connection out of the pool and always hand it back on exit.
+        close() on a pooled connection only re-queues it; the pool checks every
+        connection it hands out (is_connected()) and reconnects dead ones itself.
+        """
+        conn = self.get_connection()
+        try:
+            yield conn
+        except mysql.connector.Error as e:
+            if e.errno in LOST_CONNECTION_ERRNOS:
+                logger.warning("🔌 Lost database connection (errno %s), pool will reconnect on next checkout", e.errno)
+            raise
+        else:
+            self.last_success = time.monotonic()
+        finally:
+            conn.close()
+
+    def _cached_cursor(self, conn, key: str, **cursor_kwargs):
+        """
+        Return a cursor cached on the pooled connection under key, creating it on first use.
+        Hot paths reuse one cursor per connection instead of opening and closing one per call;
+        execute() resets its state. The cache is dropped when the pool has reconnected the
+        underlying connection, since cursors (and prepared statements) belong to a session.
+        """
+        cnx = getattr(conn, "_cnx", conn)
+        cache = getattr(cnx, "_cached_cursors", None)
+        if cache is None or cache.get("_session") != cnx.connection_id:
+            cache = {"_session": cnx.connection_id}
+            cnx._cached_cursors = cache
+
+        cursor = cache.get(key)
+        if cursor is None:
+            cursor = cnx.cursor(**cursor_kwargs)
+            cache[key] = cursor
+        return cursor
+
+    def _execute_prepared(self, conn, sql: str, params: tuple):
+        """
+        Execute a hot statement through a server-side prepared statement.
+        Prepared cursors are cached per connection and keyed by SQL text,
+        so MySQL parses each statement once per session.
+        """
+        # The pool hands out buffered connections; prepared cursors can't be buffered
+        cursor = self._cached_cursor(conn, sql, prepared=True, buffered=False)
+        cursor.execute(sql, params)
+
     def _create_tables(self):
         """Create database tables with error handling"""
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 # Sensor data table
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS sensor_data (
@@ -438,35 +732,117 @@ class DatabaseManager:
             log_critical_error("db", e, "Failed to create database tables")
         except Exception as e:
             log_critical_error("db", e, "Unexpected error creating database tables")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
-    def store_sensor_data(self, device_id: str, payload: dict):
-        """Store sensor data in database using a connection from the pool"""
-        conn = None
+    @staticmethod
+    def _payload_json(payload: Union[dict, str, bytes]) -> str:
+        """JSON text for a sensor_data row from a dict or an already serialized payload"""
+        if isinstance(payload, str):
+            return payload
+        if isinstance(payload, (bytes, bytearray)):
+            return payload.decode()
+        # orjson emits compact UTF-8 directly; decode because MySQL refuses JSON from binary strings
+        return orjson.dumps(payload).decode()
+
+    def store_sensor_data(self, device_id: str, payload: Union[dict, str, bytes]):
+        """
+        Queue sensor data for the background batch writer (never blocks the caller).
+        payload is a dict or pre-serialized JSON; dicts are serialized on the writer
+        thread, so they must not be mutated after being handed over.
+        """
+        row = (device_id, payload)
+        try:
+            self._write_q.put_nowait(row)
+        except queue.Full:
+            # Keep the freshest readings: discard the oldest queued one to make room
+            try:
+                self._write_q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._write_q.put_nowait(row)
+            except queue.Full:
+                pass
+            critical_ops["sensor_drops"] += 1
+            # Warn on the first drop of each run of 100 rather than flooding the log while MySQL is down
+            if critical_ops["sensor_drops"] % 100 == 1:
+                logger.warning("⚠️ Sensor write queue full, dropping oldest queued reading (%d dropped so far)",
+                               critical_ops["sensor_drops"])
+
+    def _sensor_writer_loop(self):
+        """Drain the sensor queue, writing up to SENSOR_BATCH_SIZE rows per INSERT, until stop_writer()"""
+        while True:
+            row = self._write_q.get()  # Block until there is something to write
+            if row is None:
+                return
+            batch = [row]
+            stopping = False
+            deadline = time.monotonic() + SENSOR_FLUSH_INTERVAL
+            while len(batch) < SENSOR_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._write_q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            self._write_sensor_batch(batch)
+            if stopping:
+                return
+
+    def stop_writer(self, timeout: float = 10.0):
+        """Let the writer thread finish the batch it is inserting, then stop it (used on shutdown)"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute(
+            # None is the stop marker; the writer is draining, so room frees up quickly
+            self._write_q.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("⚠️ Sensor writer did not take the stop marker within %.0fs", timeout)
+            return
+        self._writer_thread.join(timeout)
+
+    def _write_sensor_batch(self, batch: List[Tuple[str, Union[dict, str, bytes]]]):
+        """Insert a batch of (device_id, payload) rows with a single executemany"""
+        try:
+            # Serialize before checking out a connection, so the pool isn't held during encoding
+            batch = [(device_id, self._payload_json(payload)) for device_id, payload in batch]
+            with self.connection() as conn:
+                cursor = self._cached_cursor(conn, "write")
+                cursor.executemany(
                     "INSERT INTO sensor_data (device_id, payload) VALUES (%s, %s)",
-                    (device_id, json.dumps(payload))
+                    batch
                 )
-            logger.debug(f"📝 Stored sensor data for {device_id}")
+            logger.debug("📝 Stored %d sensor readings", len(batch))
         except mysql.connector.Error as e:
-            log_critical_error("db", e, f"Database error storing data for {device_id}")
+            log_critical_error("db", e, f"Database error storing {len(batch)} sensor readings")
         except Exception as e:
-            log_critical_error("db", e, f"Unexpected error storing sensor data for {device_id}")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
+            log_critical_error("db", e, f"Unexpected error storing {len(batch)} sensor readings")
+
+    def flush_sensor_data(self):
+        """Synchronously write everything still waiting in the sensor queue (used on shutdown)"""
+        batch = []
+        while True:
+            try:
+                row = self._write_q.get_nowait()
+            except queue.Empty:
+                break
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= SENSOR_BATCH_SIZE:
+                self._write_sensor_batch(batch)
+                batch = []
+        if batch:
+            self._write_sensor_batch(batch)
 
     def get_recent_data(self, hours: int = 24) -> List[dict]:
         """Get recent sensor data using a connection from the pool"""
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor(dictionary=True) as cursor:
+            # Unbuffered: rows are decoded as they stream in instead of the whole
+            # window being held client-side before the loop starts
+            with self.connection() as conn, conn.cursor(dictionary=True, buffered=False) as cursor:
                 cursor.execute("""
                     SELECT device_id, payload, timestamp
                     FROM sensor_data
@@ -474,11 +850,12 @@ class DatabaseManager:
                     ORDER BY timestamp DESC
                 """, (hours,))
 
-                results = cursor.fetchall()
-                # Manually convert payload from string to dict if needed
-                for row in results:
-                    if isinstance(row['payload'], str):
-                        row['payload'] = json.loads(row['payload'])
+                results = []
+                for row in cursor:
+                    # Manually convert payload from string to dict if needed (orjson takes str or bytes)
+                    if isinstance(row['payload'], (str, bytes, bytearray)):
+                        row['payload'] = orjson.loads(row['payload'])
+                    results.append(row)
                 return results
         except mysql.connector.Error as e:
             log_critical_error("db", e, "Database error during data retrieval")
@@ -486,17 +863,43 @@ class DatabaseManager:
         except Exception as e:
             log_critical_error("db", e, "Unexpected error during data retrieval")
             return []
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
+
+    def get_recent_stats(self, hours: int = 24) -> List[dict]:
+        """Get per-device reading counts and sensor averages, aggregated in MySQL"""
+        try:
+            with self.connection() as conn, conn.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT device_id,
+                           COUNT(*) AS readings,
+                           MAX(timestamp) AS last_seen,
+                           AVG(JSON_EXTRACT(payload, '$.lux')) AS avg_lux,
+                           AVG(JSON_EXTRACT(payload, '$.temperature')) AS avg_temperature,
+                           AVG(JSON_EXTRACT(payload, '$.humidity')) AS avg_humidity,
+                           AVG(JSON_EXTRACT(payload, '$.co2')) AS avg_co2,
+                           AVG(JSON_EXTRACT(payload, '$.occupancy')) AS occupancy_rate
+                    FROM sensor_data
+                    WHERE timestamp >= NOW() - INTERVAL %s HOUR
+                    GROUP BY device_id
+                """, (hours,))
+
+                results = cursor.fetchall()
+                for row in results:
+                    for key in ('avg_lux', 'avg_temperature', 'avg_humidity', 'avg_co2', 'occupancy_rate'):
+                        if row[key] is not None:
+                            row[key] = round(float(row[key]), 2)
+                return results
+        except mysql.connector.Error as e:
+            log_critical_error("db", e, "Database error during stats aggregation")
+            return []
+        except Exception as e:
+            log_critical_error("db", e, "Unexpected error during stats aggregation")
+            return []
 
     def save_override(self, device_id: str, status: str, override_type: str, expires_at: Optional[datetime] = None):
         """Save device override to database"""
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("""
+            with self.connection() as conn:
+                self._execute_prepared(conn, """
                     INSERT INTO device_overrides (device_id, status, override_type, expires_at)
                     VALUES (%s, %s, %s, %s)
                     ON DUPLICATE KEY UPDATE
@@ -510,79 +913,85 @@ class DatabaseManager:
             print(f"❌ Override save error: {e}")
         except Exception as e:
             log_critical_error("db", e, f"Unexpected error saving override for {device_id}")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
     def load_overrides(self):
         """Load active overrides from database"""
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor(dictionary=True) as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     SELECT device_id, status, override_type, expires_at
                     FROM device_overrides
                     WHERE expires_at IS NULL OR expires_at > NOW()
                 """)
 
-                overrides = {}
-                for row in cursor.fetchall():
-                    overrides[row['device_id']] = {
-                        'status': row['status'],
-                        'type': row['override_type'],
-                        'expires_at': row['expires_at']
+                return {
+                    device_id: {
+                        'status': status,
+                        'type': override_type,
+                        'expires_at': expires_at,
+                        # Epoch float for the per-reading expiry check; inf never expires
+                        'expires_at_ts': expires_at.timestamp() if expires_at else float('inf')
                     }
-                return overrides
+                    for device_id, status, override_type, expires_at in cursor.fetchall()
+                }
         except mysql.connector.Error as e:
             print(f"❌ Override load error: {e}")
             return {}
         except Exception as e:
             log_critical_error("db", e, "Unexpected error loading overrides")
             return {}
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
     def delete_override(self, device_id: str):
         """Delete device override from database"""
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("DELETE FROM device_overrides WHERE device_id = %s", (device_id,))
             print(f"💾 Override deleted from database: {device_id}")
         except mysql.connector.Error as e:
             print(f"❌ Override delete error: {e}")
         except Exception as e:
             log_critical_error("db", e, f"Unexpected error deleting override for {device_id}")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
-    def get_energy_stats(self):
-        """Get current energy statistics from database"""
-        conn = None
+    def _refresh_energy_stats(self) -> Optional[dict]:
+        """Read the energy_stats row into the in-memory snapshot"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("SELECT total_decisions, energy_saved, ambient_overrides, optimization_events FROM energy_stats WHERE id = 1")
                 row = cursor.fetchone()
-
-            if row:
-                return {
-                    "total_decisions": int(row[0]),
-                    "energy_saved": float(row[1]),
-                    "ambient_overrides": int(row[2]),
-                    "optimization_events": int(row[3])
-                }
         except mysql.connector.Error as e:
             print(f"❌ Energy stats get error: {e}")
+            return None
         except Exception as e:
             log_critical_error("db", e, "Unexpected error getting energy stats")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
+            return None
+
+        if not row:
+            return None
+
+        with self._stats_lock:
+            self._stats_cache = {
+                "total_decisions": int(row[0]),
+                "energy_saved": float(row[1]),
+                "ambient_overrides": int(row[2]),
+                "optimization_events": int(row[3])
+            }
+            self._stats_cache_ts = time.monotonic()
+            return dict(self._stats_cache)
+
+    def get_energy_stats(self):
+        """Get current energy statistics (served from memory, re-read from the database every STATS_CACHE_TTL)"""
+        with self._stats_lock:
+            if self._stats_cache is not None and time.monotonic() - self._stats_cache_ts < STATS_CACHE_TTL:
+                return dict(self._stats_cache)
+
+        stats = self._refresh_energy_stats()
+        if stats:
+            return stats
+
+        # Database unreachable: a stale snapshot beats zeros
+        with self._stats_lock:
+            if self._stats_cache is not None:
+                return dict(self._stats_cache)
 
         # Fallback if anything goes wrong
         return {
@@ -592,37 +1001,52 @@ class DatabaseManager:
 
     def update_energy_stats(self, total_decisions=None, energy_saved=None, ambient_overrides=None, optimization_events=None, baseline_energy=None, ml_energy=None):
         """Update energy statistics in database"""
-        conn = None
         try:
-            updates = []
-            values = []
-
-            if total_decisions is not None: updates.append("total_decisions = %s"); values.append(total_decisions)
-            if energy_saved is not None: updates.append("energy_saved = %s"); values.append(energy_saved)
-            if ambient_overrides is not None: updates.append("ambient_overrides = %s"); values.append(ambient_overrides)
-            if optimization_events is not None: updates.append("optimization_events = %s"); values.append(optimization_events)
-            if baseline_energy is not None: updates.append("baseline_energy = %s"); values.append(baseline_energy)
-            if ml_energy is not None: updates.append("ml_energy = %s"); values.append(ml_energy)
-
-            if updates:
-                conn = self.get_connection()
-                with conn.cursor() as cursor:
-                    query = f"UPDATE energy_stats SET {', '.join(updates)} WHERE id = 1"
-                    cursor.execute(query, values)
+            fields = {
+                "total_decisions": total_decisions, "energy_saved": energy_saved,
+                "ambient_overrides": ambient_overrides, "optimization_events": optimization_events,
+                "baseline_energy": baseline_energy, "ml_energy": ml_energy
+            }
+            fields = {name: value for name, value in fields.items() if value is not None}
+
+            if fields:
+                with self._stats_lock:
+                    for name, value in fields.items():
+                        if self._stats_cache is not None and name in self._stats_cache:
+                            self._stats_cache[name] = value
+
+                with self.connection() as conn, conn.cursor() as cursor:
+                    query = f"UPDATE energy_stats SET {', '.join(f'{name} = %s' for name in fields)} WHERE id = 1"
+                    cursor.execute(query, tuple(fields.values()))
         except mysql.connector.Error as e:
             print(f"❌ Energy stats update error: {e}")
         except Exception as e:
             log_critical_error("db", e, "Unexpected error updating energy stats")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
+
+    def reset_energy_stats(self):
+        """Zero all energy statistics in the database and in memory"""
+        with self._stats_lock:
+            self._stats_cache = {
+                "total_decisions": 0, "energy_saved": 0.0,
+                "ambient_overrides": 0, "optimization_events": 0
+            }
+
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE energy_stats
+                SET total_decisions = 0,
+                    energy_saved = 0.000,
+                    ambient_overrides = 0,
+                    optimization_events = 0,
+                    baseline_energy = 0.000,
+                    ml_energy = 0.000
+                WHERE id = 1
+            """)
 
     def increment_energy_stats(self, total_decisions=0, energy_saved=0.0, ambient_overrides=0, optimization_events=0, baseline_energy=0.0, ml_energy=0.0):
-        """Increment energy statistics in database"""
-        conn = None
+        """Increment energy statistics in database and in the in-memory snapshot"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     UPDATE energy_stats SET
                         total_decisions = total_decisions + %s,
@@ -634,110 +1058,89 @@ class DatabaseManager:
                     WHERE id = 1
                 """, (total_decisions, energy_saved, ambient_overrides, optimization_events, baseline_energy, ml_energy))
 
+            with self._stats_lock:
+                cache = self._stats_cache
+                if cache is not None:
+                    cache["total_decisions"] += total_decisions
+                    cache["energy_saved"] += energy_saved
+                    cache["ambient_overrides"] += ambient_overrides
+                    cache["optimization_events"] += optimization_events
+
             if total_decisions > 0 or energy_saved > 0 or ambient_overrides > 0 or optimization_events > 0:
                 print(f"📊 Stats updated: decisions+{total_decisions}, energy_saved+{energy_saved:.3f}kWh, ambient+{ambient_overrides}, events+{optimization_events}")
         except mysql.connector.Error as e:
             print(f"❌ Energy stats increment error: {e}")
         except Exception as e:
             log_critical_error("db", e, "Unexpected error incrementing energy stats")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
     def get_device_locations_from_db(self) -> Dict[str, str]:
         """Get device-to-location mapping from database for all devices that have ever transmitted data"""
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor(dictionary=True) as cursor:
-                # Get the most recent location for each device that has ever transmitted data
+            with self.connection() as conn, conn.cursor() as cursor:
+                # Get the most recent location for each device that has ever transmitted data.
+                # MySQL picks the latest row per device, so only one row per device comes back
                 cursor.execute("""
-                    SELECT device_id, JSON_UNQUOTE(JSON_EXTRACT(payload, '$.location')) as location
-                    FROM sensor_data
-                    WHERE JSON_EXTRACT(payload, '$.location') IS NOT NULL
-                    AND JSON_EXTRACT(payload, '$.location') != 'null'
-                    ORDER BY timestamp DESC
+                    SELECT device_id, location
+                    FROM (
+                        SELECT device_id,
+                               JSON_UNQUOTE(JSON_EXTRACT(payload, '$.location')) AS location,
+                               ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY timestamp DESC) AS rn
+                        FROM sensor_data
+                        WHERE JSON_EXTRACT(payload, '$.location') IS NOT NULL
+                        AND JSON_EXTRACT(payload, '$.location') != 'null'
+                        AND JSON_UNQUOTE(JSON_EXTRACT(payload, '$.location')) != ''
+                    ) latest
+                    WHERE rn = 1
                 """)
 
-                locations = {}
-                seen_devices = set()
-
-                for row in cursor.fetchall():
-                    device_id = row['device_id']
-                    location = row['location']
-
-                    # Only take the first (most recent) entry for each device
-                    if device_id not in seen_devices and location:
-                        locations[device_id] = location
-                        seen_devices.add(device_id)
-
-                return locations
+                return dict(cursor.fetchall())
         except mysql.connector.Error as e:
             log_critical_error("db", e, "Database error getting device locations")
             return {}
         except Exception as e:
             log_critical_error("db", e, "Unexpected error getting device locations")
             return {}
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
     def save_border_router_mapping(self, device_id: str, ip_address: str):
         """Save border router device mapping to database"""
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("""
+            with self.connection() as conn:
+                self._execute_prepared(conn, """
                     INSERT INTO border_router_mappings (device_id, ip_address, last_seen)
                     VALUES (%s, %s, NOW())
                     ON DUPLICATE KEY UPDATE
                     ip_address = VALUES(ip_address),
                     last_seen = NOW()
                 """, (device_id, ip_address))
-            logger.debug(f"💾 Saved border router mapping: {device_id} -> {ip_address}")
+            logger.debug("💾 Saved border router mapping: %s -> %s", device_id, ip_address)
         except mysql.connector.Error as e:
             log_critical_error("db", e, f"Database error saving border router mapping for {device_id}")
         except Exception as e:
             log_critical_error("db", e, f"Unexpected error saving border router mapping for {device_id}")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
-    def load_border_router_mappings(self) -> Dict[str, str]:
-        """Load border router device mappings from database"""
-        conn = None
+    def load_border_router_mappings(self, max_age_hours: int = 24) -> Dict[str, str]:
+        """Load border router device mappings seen within max_age_hours from database"""
         try:
-            conn = self.get_connection()
-            with conn.cursor(dictionary=True) as cursor:
-                # Get mappings that are less than 24 hours old (devices should rediscover if they've been gone too long)
+            with self.connection() as conn, conn.cursor() as cursor:
+                # Only recent mappings (devices should rediscover if they've been gone too long)
                 cursor.execute("""
                     SELECT device_id, ip_address
                     FROM border_router_mappings
-                    WHERE last_seen >= NOW() - INTERVAL 24 HOUR
-                """)
-
-                mappings = {}
-                for row in cursor.fetchall():
-                    mappings[row['device_id']] = row['ip_address']
+                    WHERE last_seen >= NOW() - INTERVAL %s HOUR
+                """, (max_age_hours,))
 
-                return mappings
+                return dict(cursor.fetchall())
         except mysql.connector.Error as e:
             log_critical_error("db", e, "Database error loading border router mappings")
             return {}
         except Exception as e:
             log_critical_error("db", e, "Unexpected error loading border router mappings")
             return {}
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
     def cleanup_stale_mappings(self, max_age_hours: int = 24):
         """Remove stale border router mappings older than max_age_hours"""
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     DELETE FROM border_router_mappings
                     WHERE last_seen < NOW() - INTERVAL %s HOUR
@@ -745,55 +1148,66 @@ class DatabaseManager:
                 deleted_count = cursor.rowcount
                 conn.commit()
                 if deleted_count > 0:
-                    logger.info(f"🧹 Cleaned up {deleted_count} stale border router mappings")
+                    logger.info("🧹 Cleaned up %d stale border router mappings", deleted_count)
         except mysql.connector.Error as e:
             log_critical_error("db", e, "Database error cleaning up stale mappings")
         except Exception as e:
             log_critical_error("db", e, "Unexpected error cleaning up stale mappings")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
     def save_device_schedule(self, device_id: str, schedule: list):
         """Save weekly temperature schedule for a device (168 hourly values)"""
-        conn = None
+        self.save_device_schedules([(device_id, schedule)])
+
+    def save_device_schedules(self, items: List[Tuple[str, list]]):
+        """Save weekly temperature schedules for several devices with one multi-row upsert"""
+        if not items:
+            return
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                schedule_json = json.dumps(schedule)
-                cursor.execute("""
+            values = [(device_id, orjson.dumps(schedule).decode()) for device_id, schedule in items]
+            with self.connection() as conn, conn.cursor() as cursor:
+                # mysql-connector rewrites this into a single INSERT ... VALUES (...), (...) statement
+                cursor.executemany("""
                     INSERT INTO device_schedules (device_id, schedule, last_updated)
                     VALUES (%s, %s, NOW())
                     ON DUPLICATE KEY UPDATE
                     schedule = VALUES(schedule),
                     last_updated = NOW()
-                """, (device_id, schedule_json))
-                conn.commit()
-                logger.info(f"💾 Saved schedule for {device_id} ({len(schedule)} values)")
+                """, values)
+            # Write-through: the broadcaster picks up the new schedules without a read
+            expires_at = time.monotonic() + SCHEDULE_CACHE_TTL
+            with self._schedule_lock:
+                for device_id, schedule in items:
+                    self._schedule_cache[device_id] = (expires_at, list(schedule))
+            if len(items) == 1:
+                logger.info("💾 Saved schedule for %s (%d values)", items[0][0], len(items[0][1]))
+            else:
+                logger.info("💾 Saved schedules for %d devices", len(items))
         except mysql.connector.Error as e:
-            log_critical_error("db", e, f"Database error saving schedule for {device_id}")
+            log_critical_error("db", e, "Database error saving schedules for %s", [device_id for device_id, _ in items])
         except Exception as e:
-            log_critical_error("db", e, f"Unexpected error saving schedule for {device_id}")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
+            log_critical_error("db", e, "Unexpected error saving schedules for %s", [device_id for device_id, _ in items])
 
     def load_device_schedule(self, device_id: str) -> Optional[list]:
-        """Load weekly temperature schedule for a device"""
-        conn = None
+        """Load weekly temperature schedule for a device (cached for SCHEDULE_CACHE_TTL)"""
+        with self._schedule_lock:
+            cached = self._schedule_cache.get(device_id)
+        if cached is not None and time.monotonic() < cached[0]:
+            return list(cached[1])
+
         try:
-            conn = self.get_connection()
-            with conn.cursor(dictionary=True) as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
-                    SELECT schedule, last_updated, last_broadcast
+                    SELECT schedule
                     FROM device_schedules
                     WHERE device_id = %s
                 """, (device_id,))
                 result = cursor.fetchone()
                 if result:
-                    schedule = json.loads(result['schedule'])
-                    logger.debug(f"📋 Loaded schedule for {device_id} ({len(schedule)} values)")
-                    return schedule
+                    schedule = orjson.loads(result[0])
+                    logger.debug("📋 Loaded schedule for %s (%d values)", device_id, len(schedule))
+                    with self._schedule_lock:
+                        self._schedule_cache[device_id] = (time.monotonic() + SCHEDULE_CACHE_TTL, schedule)
+                    return list(schedule)
                 return None
         except mysql.connector.Error as e:
             log_critical_error("db", e, f"Database error loading schedule for {device_id}")
@@ -801,69 +1215,73 @@ class DatabaseManager:
         except Exception as e:
             log_critical_error("db", e, f"Unexpected error loading schedule for {device_id}")
             return None
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
     def update_schedule_broadcast_time(self, device_id: str):
         """Update last_broadcast timestamp for device schedule"""
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("""
+            with self.connection() as conn:
+                self._execute_prepared(conn, """
                     UPDATE device_schedules
                     SET last_broadcast = NOW()
                     WHERE device_id = %s
                 """, (device_id,))
-                conn.commit()
         except mysql.connector.Error as e:
             log_critical_error("db", e, f"Database error updating broadcast time for {device_id}")
         except Exception as e:
             log_critical_error("db", e, f"Unexpected error updating broadcast time for {device_id}")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
-    def get_devices_needing_schedule_broadcast(self, interval_seconds: int = 300) -> List[str]:
-        """Get list of device IDs that need schedule broadcast (first time or periodic refresh)"""
-        conn = None
+    def update_schedule_broadcast_times(self, device_ids: List[str]):
+        """Update last_broadcast timestamp for several device schedules with one UPDATE"""
+        if not device_ids:
+            return
         try:
-            conn = self.get_connection()
-            with conn.cursor(dictionary=True) as cursor:
-                # Get devices that have schedules but haven't been broadcast recently
+            with self.connection() as conn, conn.cursor() as cursor:
+                placeholders = ", ".join(["%s"] * len(device_ids))
+                cursor.execute(f"""
+                    UPDATE device_schedules
+                    SET last_broadcast = NOW()
+                    WHERE device_id IN ({placeholders})
+                """, tuple(device_ids))
+        except mysql.connector.Error as e:
+            log_critical_error("db", e, "Database error updating broadcast time for %s", device_ids)
+        except Exception as e:
+            log_critical_error("db", e, "Unexpected error updating broadcast time for %s", device_ids)
+
+    def get_schedule_broadcast_ages(self) -> Optional[List[Tuple[str, Optional[int]]]]:
+        """
+        (device_id, seconds since last broadcast, or None if never broadcast) for every stored schedule.
+        Returns None if the database could not be read.
+        """
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                # Age is computed by MySQL, so server/controller clock and timezone differences don't matter
                 cursor.execute("""
-                    SELECT device_id
+                    SELECT device_id, TIMESTAMPDIFF(SECOND, last_broadcast, NOW())
                     FROM device_schedules
-                    WHERE last_broadcast IS NULL
-                       OR last_broadcast < NOW() - INTERVAL %s SECOND
-                """, (interval_seconds,))
-                devices = [row['device_id'] for row in cursor.fetchall()]
-                return devices
+                """)
+                return cursor.fetchall()
         except mysql.connector.Error as e:
-            log_critical_error("db", e, "Database error getting devices needing schedule broadcast")
-            return []
+            log_critical_error("db", e, "Database error loading schedule broadcast times")
+            return None
         except Exception as e:
-            log_critical_error("db", e, "Unexpected error getting devices needing schedule broadcast")
-            return []
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
+            log_critical_error("db", e, "Unexpected error loading schedule broadcast times")
+            return None
 
 # Initialize database with connection pooling
 db = DatabaseManager()
 
 def load_ml_model():
-    """Load trained ML model and parameters"""
+    """Load the trained ML model; None means rule-based fallback"""
     model = None
-    feature_stats = None
-    params = None
 
-    logger.info("🧠 Loading ML model and parameters...")
+    logger.info("🧠 Loading ML model...")
 
     # Try to load the actual trained model
     try:
-        model = joblib.load('/app/ml/energy_saving_lighting_model.joblib')
+        # Memory-map the estimator's arrays from the read-only model file instead of copying
+        # them onto the heap; pages come from (and are shared through) the page cache.
+        # mmap only applies to uncompressed dumps - compressed files are loaded into memory as before.
+        model = joblib.load('/app/ml/energy_saving_lighting_model.joblib', mmap_mode='r')
         logger.info("✅ Trained ML model loaded successfully")
     except FileNotFoundError:
         logger.warning("⚠️ Trained model not found at /app/ml/energy_saving_lighting_model.joblib")
@@ -885,6 +1303,13 @@ def load_ml_model():
         logger.warning("⚠️ Using rule-based fallback to prevent crashes")
         model = None
 
+    return model
+
+def load_ml_params():
+    """Load feature statistics and model parameters (small JSON files, read at import)"""
+    feature_stats = None
+    params = None
+
     # Load feature statistics for normalization
     try:
         with open('/app/ml/feature_stats.json', 'r') as f:
@@ -927,50 +1352,93 @@ def load_ml_model():
             }
         }
 
-    return model, feature_stats, params
-
-# Load ML components
-trained_model, feature_stats, model_params = load_ml_model()
+    return feature_stats, params
+
+# The model was fitted on a DataFrame; features are passed as a plain array in training
+# column order, so silence sklearn's per-predict feature-name warning
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# Model parameters are needed at import; the model itself is loaded on first use
+feature_stats, model_params = load_ml_params()
+
+# Trained model once loaded (None until then), and whether loading was attempted
+_ml_model = None
+_ml_model_loaded = False
+_ml_model_lock = threading.Lock()
+
+def get_ml_model():
+    """Return the trained model, loading it on first use; None means rule-based fallback"""
+    global _ml_model, _ml_model_loaded
+    if not _ml_model_loaded:
+        with _ml_model_lock:
+            if not _ml_model_loaded:
+                _ml_model = load_ml_model()
+                _ml_model_loaded = True
+    return _ml_model
+
+def hour_mask(hours) -> int:
+    """24-bit mask with bit h set for each hour h; test membership with (mask >> hour) & 1"""
+    mask = 0
+    for hour in hours:
+        mask |= 1 << hour
+    return mask
+
+# Hour sets used by the rule-based decisions, precomputed as bitmasks
+PEAK_MASK = hour_mask(model_params.get('energy_saving_rules', {}).get('peak_waste_hours', []))
+NIGHT_MASK = hour_mask([23, 0, 1, 2, 3, 4, 5])
 print(f"🧠 ML System: {model_params.get('model_type', 'disabled')}")
 print(f"⚡ Energy efficiency: {model_params.get('energy_efficiency_improvement', 'N/A')}")
 print(f"🎯 Operating mode: MANUAL ONLY - No automatic LED control decisions")
 
-def prepare_ml_features(sensor_data: dict):
+# (wall-clock time the cached hour stops being valid, cached hour)
+_hour_cache = (0.0, 0)
+
+def _cur_hour() -> int:
     """
-    Prepare sensor data for ML model prediction
-    Returns pandas DataFrame with proper feature names to avoid sklearn warnings
-    Expected features: ['hour_of_day', 'total_room_usage', 'lights_currently_on',
-                       'space_occupied', 'solar_surplus', 'cloudCover', 'visibility']
+    Current local hour for per-message decisions, recomputed only when the hour rolls over
+    instead of building a datetime on every reading. Use datetime.now() for timestamps.
     """
-    current_hour = datetime.now().hour
+    global _hour_cache
+    t = time.time()
+    if t >= _hour_cache[0]:
+        now = datetime.now()
+        seconds_into_hour = now.minute * 60 + now.second + now.microsecond / 1e6
+        # Tuple replace is atomic, so concurrent callers see either the old or the new pair
+        _hour_cache = (t - seconds_into_hour + 3600, now.hour)
+    return _hour_cache[1]
+
+def predict_ml(features: np.ndarray) -> Tuple[int, float]:
+    """Run the lighting model on one feature row; returns (predicted class, confidence)"""
+    trained_model = get_ml_model()
+    prediction = trained_model.predict(features)[0]
+    return int(prediction), float(trained_model.predict_proba(features)[0].max())
+
+# ML decision outcomes keyed by (model suggests saving, room occupied, ambient lux >= 60):
+# (action, ml_energy_kwh, reason prefix). Baseline: lights always ON when occupied (150W)
+_ML_ACTIONS = {
+    # Room is occupied but ML suggests saving energy
+    (True, True, True): ("turn_off", 0.0, "ml_prediction_sufficient_ambient_light"),  # Sufficient ambient light
+    (True, True, False): ("reduce_lighting", 0.075, "ml_prediction_optimize_occupied_space"),  # 50% of 150W
+    # Room unoccupied - ML keeps lights off (same as baseline)
+    (True, False, True): ("turn_off", 0.0, "ml_prediction_unoccupied_space"),
+    (True, False, False): ("turn_off", 0.0, "ml_prediction_unoccupied_space"),
+    # Room occupied - ML agrees with baseline to have lights on
+    (False, True, True): ("turn_on", 0.15, "ml_prediction_appropriate_usage"),
+    (False, True, False): ("turn_on", 0.15, "ml_prediction_appropriate_usage"),
+    # Room unoccupied - ML keeps lights off
+    (False, False, True): ("turn_off", 0.0, "ml_prediction_keep_off_unoccupied"),
+    (False, False, False): ("turn_off", 0.0, "ml_prediction_keep_off_unoccupied"),
+}
 
-    # Extract sensor values with defaults
-    lux = sensor_data.get('lux', 50)
-    occupancy = sensor_data.get('occupancy', 0)
-    room_usage = sensor_data.get('room_usage', 0.0)
+def _ml_action(sensor_data: dict, prediction: int, confidence: float) -> Tuple[str, float, str]:
+    """Turn a model prediction for one reading into (action, energy_saved_vs_baseline_kwh, reason)"""
+    occupied = sensor_data.get('occupancy', 0) > 0
+    action, ml_energy, reason = _ML_ACTIONS[(prediction == 1, occupied, sensor_data.get('lux', 50) >= 60)]
 
-    # Infer additional features
-    lights_currently_on = 1 if room_usage > 0.15 else 0  # Updated threshold for 150W LEDs
-    space_occupied = occupancy  # Direct mapping
-
-    # Environmental features (with defaults if not available)
-    solar_surplus = sensor_data.get('solar_surplus', -0.95)  # Default from training data
-    cloud_cover = sensor_data.get('cloudCover', 0.2)
-    visibility = sensor_data.get('visibility', 9.5)
-
-    # Create DataFrame with proper feature names (prevents sklearn warnings)
-    feature_data = {
-        'hour_of_day': [current_hour],
-        'total_room_usage': [room_usage],
-        'lights_currently_on': [lights_currently_on],
-        'space_occupied': [space_occupied],
-        'solar_surplus': [solar_surplus],
-        'cloudCover': [cloud_cover],
-        'visibility': [visibility]
-    }
+    # Calculate energy savings vs baseline (0.15 kWh when occupied)
+    energy_saved = (0.15 if occupied else 0.0) - ml_energy
 
-    features_df = pd.DataFrame(feature_data)
-    return features_df
+    return action, energy_saved, f"{reason}_conf_{confidence:.2f}"
 
 def ml_energy_decision(sensor_data: dict) -> Tuple[str, float, str]:
     """
@@ -980,62 +1448,26 @@ def ml_energy_decision(sensor_data: dict) -> Tuple[str, float, str]:
     Baseline assumption: Lights are always ON when room is occupied
     Energy savings calculated as difference between baseline and ML decision
     """
-    if trained_model is None:
+    if get_ml_model() is None:
         # Fallback to rule-based if model not available
         return rule_based_energy_decision(sensor_data)
 
     try:
-        # Prepare features for ML model
-        features = prepare_ml_features(sensor_data)
-
-        # Get ML prediction
-        prediction = trained_model.predict(features)[0]  # 0 = keep current, 1 = save energy
-        prediction_proba = trained_model.predict_proba(features)[0]
-        confidence = max(prediction_proba)
-
-        # Extract relevant data for energy calculation
-        room_usage = sensor_data.get('room_usage', 0.0)
         occupancy = sensor_data.get('occupancy', 0)
-        lux = sensor_data.get('lux', 50)
-
-        # BASELINE CALCULATION: What would baseline behavior be?
-        # Baseline: Always turn lights ON when room is occupied (150W = 0.15kW)
-        baseline_energy = 0.15 if occupancy > 0 else 0.0
-
-        # ML DECISION LOGIC
-        if prediction == 1:  # Model suggests saving energy
-            if occupancy > 0:
-                # Room is occupied but ML suggests saving energy
-                if lux >= 60:  # Sufficient ambient light
-                    action = "turn_off"
-                    ml_energy = 0.0  # ML keeps lights off
-                    reason = f"ml_prediction_sufficient_ambient_light_conf_{confidence:.2f}"
-                else:
-                    # Occupied but ML optimizes consumption
-                    action = "reduce_lighting"
-                    ml_energy = 0.075  # Reduced lighting (50% of 150W)
-                    reason = f"ml_prediction_optimize_occupied_space_conf_{confidence:.2f}"
-            else:
-                # Room unoccupied - ML keeps lights off (same as baseline)
-                action = "turn_off"
-                ml_energy = 0.0
-                reason = f"ml_prediction_unoccupied_space_conf_{confidence:.2f}"
-        else:  # Model suggests keeping current state or turning on
-            if occupancy > 0:
-                # Room occupied - ML agrees with baseline to have lights on
-                action = "turn_on"
-                ml_energy = 0.15  # Full lighting
-                reason = f"ml_prediction_appropriate_usage_conf_{confidence:.2f}"
-            else:
-                # Room unoccupied - ML keeps lights off
-                action = "turn_off"
-                ml_energy = 0.0
-                reason = f"ml_prediction_keep_off_unoccupied_conf_{confidence:.2f}"
+        room_usage = sensor_data.get('room_usage', 0.0)
 
-        # Calculate energy savings vs baseline
-        energy_saved = baseline_energy - ml_energy
+        # Columns in training order: hour_of_day, total_room_usage, lights_currently_on,
+        # space_occupied, solar_surplus, cloudCover, visibility
+        features = np.array([[
+            _cur_hour(), room_usage, 1 if room_usage > 0.15 else 0, occupancy,
+            sensor_data.get('solar_surplus', -0.95),  # Default from training data
+            sensor_data.get('cloudCover', 0.2),
+            sensor_data.get('visibility', 9.5)
+        ]], dtype=np.float32)
 
-        return action, energy_saved, reason
+        # Get ML prediction (0 = keep current, 1 = save energy)
+        prediction, confidence = predict_ml(features)
+        return _ml_action(sensor_data, prediction, confidence)
 
     except Exception as e:
         print(f"❌ ML prediction error: {e}")
@@ -1052,8 +1484,7 @@ def rule_based_energy_decision(sensor_data: dict) -> Tuple[str, float, str]:
     occupancy = sensor_data.get('occupancy', 0)
     room_usage = sensor_data.get('room_usage', 0.0)
 
-    current_hour = datetime.now().hour
-    rules = model_params['energy_saving_rules']
+    current_hour = _cur_hour()
 
     # BASELINE: What would baseline behavior be?
     baseline_energy = 0.15 if occupancy > 0 else 0.0  # 150W when occupied
@@ -1069,12 +1500,12 @@ def rule_based_energy_decision(sensor_data: dict) -> Tuple[str, float, str]:
         action = "turn_off"
         reason = "rule_based_empty_space"
     # Peak hour optimization - reduce consumption even when occupied
-    elif current_hour in rules['peak_waste_hours'] and occupancy > 0:
+    elif (PEAK_MASK >> current_hour) & 1 and occupancy > 0:
         rule_energy = 0.075  # Reduced lighting (50% of 150W)
         action = "reduce_lighting"
         reason = "rule_based_peak_hour_optimization"
     # Night energy saving - be more conservative
-    elif (current_hour >= 23 or current_hour <= 5) and occupancy > 0:
+    elif (NIGHT_MASK >> current_hour) & 1 and occupancy > 0:
         if lux >= 40:  # Some ambient light available at night
             rule_energy = 0.0  # Turn off even when occupied
             action = "turn_off"
@@ -1099,7 +1530,7 @@ def energy_saving_decision(sensor_data: dict) -> Tuple[str, float, str]:
     Main energy saving decision function - uses ML model if available, otherwise rules
     Returns: (action, energy_saved_kwh, reason)
     """
-    if trained_model is not None:
+    if get_ml_model() is not None:
         return ml_energy_decision(sensor_data)
     else:
         return rule_based_energy_decision(sensor_data)
@@ -1118,25 +1549,69 @@ def ambient_light_optimization(lux: int, led_command: str) -> Tuple[str, bool, f
 
     return led_command, False, 0.0
 
-def check_device_override(device_id: str) -> Optional[str]:
+def check_device_override(device_id: str, now: Optional[float] = None) -> Optional[dict]:
     """
     Check if device has active override
-    Returns: override status or None
+    now: epoch seconds to check expiry against (defaults to time.time())
+    Returns: the override {status, type, expires_at, expires_at_ts} or None
     """
-    if device_id not in device_overrides:
+    override = device_overrides.get(device_id)
+    if override is None:
         return None
 
-    override = device_overrides[device_id]
-
-    # Check if override has expired
-    if override.get('expires_at') and datetime.now() > override['expires_at']:
-        # Remove expired override
-        del device_overrides[device_id]
-        # Remove from database
-        db.delete_override(device_id)
+    # Expired overrides are removed by sweep_expired_overrides; until the next sweep just ignore them
+    if (time.time() if now is None else now) > override['expires_at_ts']:
         return None
 
-    return override['status']
+    return override
+
+def schedule_override_expiry(device_id: str, override: dict):
+    """Register a timed override with the expiry sweep; caller holds override_expiry_lock"""
+    if override['expires_at_ts'] != float('inf'):
+        heapq.heappush(override_expiry_heap, (override['expires_at_ts'], device_id))
+
+def sweep_expired_overrides():
+    """Remove every override whose expiry has passed, popping only due entries off the heap"""
+    now = time.time()
+    expired_devices = []
+
+    with override_expiry_lock:
+        while override_expiry_heap and override_expiry_heap[0][0] <= now:
+            expires_at_ts, device_id = heapq.heappop(override_expiry_heap)
+            override = device_overrides.get(device_id)
+            # Skip stale entries: the override was removed or replaced with a different expiry
+            if override is not None and override['expires_at_ts'] == expires_at_ts:
+                del device_overrides[device_id]
+                # Remove from database, queued under the lock so a newer save can't be overtaken
+                submit_override_write(db.delete_override, device_id)
+                expired_devices.append(device_id)
+
+    for device_id in expired_devices:
+        logger.info("⏱️ Override expired: %s", device_id)
+
+def periodic_override_sweep():
+    """Background tick that expires timed overrides, until shutdown starts"""
+    while not shutdown_event.is_set():
+        try:
+            sweep_expired_overrides()
+        except Exception as e:
+            log_critical_error("override_sweep", e, "Override expiry sweep failed")
+        shutdown_event.wait(OVERRIDE_SWEEP_INTERVAL)
+
+# Override persistence runs off the request/MQTT thread. A single worker keeps the writes
+# in submission order, so a quick set-then-disable can't land in the database reversed.
+# device_overrides is updated synchronously and is the source of truth meanwhile.
+override_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="override-db")
+
+def submit_override_write(fn, *args):
+    """
+    Queue an override database write; caller holds override_expiry_lock.
+    Once shutdown has started the queue is closed, so late writes are dropped with a warning.
+    """
+    if shutdown_event.is_set():
+        logger.warning("⚠️ Shutting down, override write %s%s not persisted", fn.__name__, args)
+        return
+    override_db_executor.submit(fn, *args)
 
 def set_device_override(device_id: str, status: str, override_type: str = "24h"):
     """
@@ -1157,28 +1632,30 @@ def set_device_override(device_id: str, status: str, override_type: str = "24h")
         expires_at = None
     elif override_type == "disabled":
         # Remove override
-        if device_id in device_overrides:
-            del device_overrides[device_id]
-
-        db.delete_override(device_id)
+        with override_expiry_lock:
+            device_overrides.pop(device_id, None)
+            submit_override_write(db.delete_override, device_id)
 
         # Send CoAP to disable override
         uri = get_device_uri(device_id)
         if uri:
             coap_payload = '{"mo": 0, "ab": 1}'  # Disable manual override, enable auto
-            asyncio.run(send_coap_request(uri, coap_payload))
+            submit_coap(send_coap_request(uri, coap_payload))
 
         print(f"🎛️ Override removed: {device_id}")
         return
 
-    device_overrides[device_id] = {
+    override = {
         'status': status,
         'type': override_type,
-        'expires_at': expires_at
+        'expires_at': expires_at,
+        'expires_at_ts': expires_at.timestamp() if expires_at else float('inf')
     }
-
-    # Save to database
-    db.save_override(device_id, status, override_type, expires_at)
+    with override_expiry_lock:
+        device_overrides[device_id] = override
+        schedule_override_expiry(device_id, override)
+        # Save to database
+        submit_override_write(db.save_override, device_id, status, override_type, expires_at)
 
     # Send CoAP to set override
     uri = get_device_uri(device_id)
@@ -1193,17 +1670,22 @@ def set_device_override(device_id: str, status: str, override_type: str = "24h")
         if override_type == "permanent":
             coap_payload = coap_payload[:-1] + ', "od": 1576800000}'  # ~50 years
 
-        asyncio.run(send_coap_request(uri, coap_payload))
+        submit_coap(send_coap_request(uri, coap_payload))
 
     print(f"🎛️ Override set: {device_id} = {status} ({override_type})")
     logger.info(f"🎛️ Override set: {device_id} = {status} ({override_type}) via CoAP")
 
-def process_sensor_data(device_id: str, payload: dict):
-    """Process incoming sensor data with heating system focus"""
+def process_sensor_data(device_id: str, payload: dict, now: Optional[float] = None):
+    """
+    Process incoming sensor data with heating system focus
+    now: epoch seconds the message was received (defaults to time.time())
+    """
+    if now is None:
+        now = time.time()
     try:
         # Validate input
         if not device_id or not isinstance(payload, dict):
-            logger.warning(f"⚠️ Invalid sensor data: device_id={device_id}, payload={type(payload)}")
+            logger.warning("⚠️ Invalid sensor data: device_id=%s, payload=%s", device_id, type(payload))
             return
 
         # Check clock synchronization status
@@ -1212,14 +1694,9 @@ def process_sensor_data(device_id: str, payload: dict):
 
         # Sync clock if not synced or drift detected (240 cycles = 1 hour)
         if clock_synced == 0 or cycles_since_sync >= 240:
-            logger.info(f"⏰ Clock sync needed for {device_id}: synced={clock_synced}, cycles={cycles_since_sync}")
-            # Schedule sync in background thread to avoid blocking
-            import threading
-            sync_thread = threading.Thread(
-                target=lambda: asyncio.run(sync_device_clock(device_id)),
-                daemon=True
-            )
-            sync_thread.start()
+            logger.info("⏰ Clock sync needed for %s: synced=%s, cycles=%s", device_id, clock_synced, cycles_since_sync)
+            # Schedule sync on the CoAP loop to avoid blocking
+            submit_coap(sync_device_clock(device_id))
 
         # Create processed data with conversions - HEATING FOCUS
         # Handle temperature values that may be integers (from new node format)
@@ -1252,7 +1729,7 @@ def process_sensor_data(device_id: str, payload: dict):
             'day': payload.get('day', 0),
             'hour': payload.get('hour', 0),
             'minute': payload.get('minute', 0),
-            'timestamp': datetime.now().isoformat()  # Convert datetime to ISO string for JSON serialization
+            'timestamp': datetime.fromtimestamp(now).isoformat()  # Convert datetime to ISO string for JSON serialization
         }
 
         # Extract IP address if provided in payload for dynamic URI mapping
@@ -1260,121 +1737,132 @@ def process_sensor_data(device_id: str, payload: dict):
         if ip_address:
             # Construct CoAP URI from IP address
             processed_data['coap_uri'] = f"coap://[{ip_address}]/settings"
-            logger.info(f"📡 Dynamic URI mapping for {device_id}: {processed_data['coap_uri']}")
+            logger.info("📡 Dynamic URI mapping for %s: %s", device_id, processed_data['coap_uri'])
 
         # Store in database
         db.store_sensor_data(device_id, processed_data)
 
-        # Update latest data
-        latest_sensor_data[device_id] = {
-            **processed_data,
-            'timestamp': processed_data['timestamp']  # Already converted to ISO string
-        }
+        # Update latest data - processed_data is built fresh per message and never mutated
+        # afterwards, so it is shared rather than copied
+        latest_sensor_data[device_id] = processed_data
 
         # Check for override first
-        override_status = check_device_override(device_id)
-        if override_status:
+        override = check_device_override(device_id, now)
+        if override:
             # Override is active - no need to send commands here since they were already sent in set_device_override()
             # Just log that override is active and return early
-            reason = f"manual_override_{device_overrides[device_id]['type']}"
-            logger.debug(f"🎛️ Override active: {device_id} = {override_status} ({reason}) - skipping sensor processing")
+            reason = f"manual_override_{override['type']}"
+            logger.debug("🎛️ Override active: %s = %s (%s) - skipping sensor processing", device_id, override['status'], reason)
             return  # Exit early, override is already active
 
         # Manual-only mode - system does NOT make automatic heating control decisions
         # Temperature predictions and sensor data are stored and monitored
         # Heating control only happens via manual overrides through web UI
-        logger.debug(f"📊 Sensor data processed for {device_id} (T: {processed_data['temperature']}°C, Pred: {processed_data['predicted_temp']}°C, Target: {processed_data['target_temp']}°C) - manual mode only")
+        logger.debug("📊 Sensor data processed for %s (T: %s°C, Pred: %s°C, Target: %s°C) - manual mode only",
+                     device_id, processed_data['temperature'], processed_data['predicted_temp'], processed_data['target_temp'])
         return
 
     except Exception as e:
         log_critical_error("sensor", e, f"Failed to process sensor data for {device_id}")
 
+# Set once the broker has accepted the controller's connection (CONNACK rc=0)
+mqtt_ready = threading.Event()
+
 # MQTT Event Handlers
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         logger.info(f"✅ MQTT connected to {MQTT_BROKER}:{MQTT_PORT}")
+        mqtt_ready.set()
         try:
-            client.subscribe("sensors/+/data")
-            client.subscribe("sensors/+/button")
+            # Both filters in one SUBSCRIBE packet
+            client.subscribe([("sensors/+/data", 0), ("sensors/+/button", 0)])
             logger.info("📡 MQTT subscriptions established")
         except Exception as e:
             log_critical_error("mqtt", e, "Failed to establish MQTT subscriptions")
     else:
         log_critical_error("mqtt", Exception(f"Connection failed with code {rc}"), f"MQTT connection to {MQTT_BROKER}:{MQTT_PORT}")
 
+# Subscribed topics: sensors/<device_id>/data and sensors/<device_id>/button
+MQTT_TOPIC_RE = re.compile(r'^sensors/([^/+#]+)/(data|button)$')
+
+# Repair for firmware payloads with an empty numeric field ("temperature":, / "co2":})
+REPAIR_EMPTY_FIELD_MID_RE = re.compile(r'("(?:predicted_temp|target_temp|temperature|humidity|co2)"\s*:\s*),')
+REPAIR_EMPTY_FIELD_END_RE = re.compile(r'("(?:predicted_temp|target_temp|temperature|humidity|co2)"\s*:\s*)}')
+
 def on_message(client, userdata, msg):
     try:
         # Validate message structure
         if not msg.topic or not msg.payload:
-            logger.warning(f"⚠️ Received invalid MQTT message: topic={msg.topic}, payload={msg.payload}")
+            logger.warning("⚠️ Received invalid MQTT message: topic=%s, payload=%s", msg.topic, msg.payload)
             return
 
-        device_id = msg.topic.split('/')[1]  # Extract device_id from topic
-
-        # Validate device_id
-        if not device_id or device_id == '+':
-            logger.warning(f"⚠️ Invalid device_id extracted from topic: {msg.topic}")
+        # Extract device_id and message kind from the topic in one match
+        topic_match = MQTT_TOPIC_RE.match(msg.topic)
+        if not topic_match:
+            logger.warning("⚠️ Invalid device_id extracted from topic: %s", msg.topic)
             return
+        device_id, topic_kind = topic_match.groups()
 
         try:
-            logger.info(f"Raw payload bytes: {msg.payload}")
-            logger.info(f"Payload as repr: {repr(msg.payload)}")
+            logger.debug("Raw payload bytes: %s", msg.payload)
+            logger.debug("Payload as repr: %r", msg.payload)
 
-            # Decode payload to string
-            payload_str = msg.payload.decode() if isinstance(msg.payload, bytes) else msg.payload
-
-            # Try to parse JSON directly first
+            # Try to parse JSON directly first - orjson reads the payload bytes as-is
+            # (orjson.JSONDecodeError subclasses json.JSONDecodeError)
             try:
-                payload = json.loads(payload_str)
+                payload = orjson.loads(msg.payload)
             except json.JSONDecodeError as e:
                 # Attempt to repair malformed JSON with missing float values
                 # Pattern: "field_name":, (missing value) -> "field_name":0.0,
-                logger.warning(f"⚠️ Attempting to repair malformed JSON from {device_id}")
+                logger.warning("⚠️ Attempting to repair malformed JSON from %s", device_id)
+
+                # Only the repair path needs the payload as a string
+                payload_str = msg.payload.decode() if isinstance(msg.payload, bytes) else msg.payload
 
                 # Fix missing float values (predicted_temp, target_temp, etc.)
-                repaired_str = re.sub(r'("(?:predicted_temp|target_temp|temperature|humidity|co2)"\s*:\s*),', r'\g<1>0.0,', payload_str)
-                repaired_str = re.sub(r'("(?:predicted_temp|target_temp|temperature|humidity|co2)"\s*:\s*)}', r'\g<1>0.0}', repaired_str)
+                repaired_str = REPAIR_EMPTY_FIELD_MID_RE.sub(r'\g<1>0.0,', payload_str)
+                repaired_str = REPAIR_EMPTY_FIELD_END_RE.sub(r'\g<1>0.0}', repaired_str)
 
                 # Try parsing the repaired JSON
                 try:
-                    payload = json.loads(repaired_str)
-                    logger.info(f"✅ Successfully repaired JSON for {device_id}")
-                    logger.debug(f"   Original: {payload_str[:200]}")
-                    logger.debug(f"   Repaired: {repaired_str[:200]}")
+                    payload = orjson.loads(repaired_str)
+                    logger.info("✅ Successfully repaired JSON for %s", device_id)
+                    logger.debug("   Original: %.200s", payload_str)
+                    logger.debug("   Repaired: %.200s", repaired_str)
                 except json.JSONDecodeError as e2:
                     # Still failed after repair attempt
-                    logger.error(f"❌ JSON repair failed for topic {msg.topic}: {e2}")
-                    logger.error(f"   Original error: {e}")
-                    logger.error(f"   Raw payload: {msg.payload}")
-                    logger.error(f"   Repaired attempt: {repaired_str[:200]}")
+                    logger.error("❌ JSON repair failed for topic %s: %s", msg.topic, e2)
+                    logger.error("   Original error: %s", e)
+                    logger.error("   Raw payload: %s", msg.payload)
+                    logger.error("   Repaired attempt: %.200s", repaired_str)
                     raise e  # Raise original error
 
         except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error for topic {msg.topic}: {e}")
-            logger.error(f"Raw payload: {msg.payload}")
-            logger.error(f"Payload type: {type(msg.payload)}")
-            logger.error(f"Payload length: {len(msg.payload) if hasattr(msg.payload, '__len__') else 'N/A'}")
+            logger.error("JSON decode error for topic %s: %s", msg.topic, e)
+            logger.error("Raw payload: %s", msg.payload)
+            logger.error("Payload type: %s", type(msg.payload))
+            logger.error("Payload length: %s", len(msg.payload) if hasattr(msg.payload, '__len__') else 'N/A')
             # Don't raise - just skip this message to prevent crash
             return
 
         # Log message processing (debug level to avoid spam)
-        logger.debug(f"📨 Processing message from {device_id}: {msg.topic}")
+        logger.debug("📨 Processing message from %s: %s", device_id, msg.topic)
 
-        if "/button" in msg.topic:
+        if topic_kind == "button":
             # Handle button press - toggle override
-            logger.info(f"🔘 Button press detected for {device_id}")
+            logger.info("🔘 Button press detected for %s", device_id)
             current_override = check_device_override(device_id)
             if current_override:
                 set_device_override(device_id, "disabled", "disabled")
-                logger.info(f"🔘 Button press: {device_id} override disabled")
+                logger.info("🔘 Button press: %s override disabled", device_id)
             else:
                 # Set 24h override to "on" (since system stays put, button press means user wants lights on)
                 set_device_override(device_id, "on", "24h")
-                logger.info(f"🔘 Button press: {device_id} override set to on (24h)")
+                logger.info("🔘 Button press: %s override set to on (24h)", device_id)
         else:
             # Regular sensor data
-            logger.debug(f"📊 Processing sensor data for {device_id}")
-            process_sensor_data(device_id, payload)
+            logger.debug("📊 Processing sensor data for %s", device_id)
+            process_sensor_data(device_id, payload, time.time())
 
     except json.JSONDecodeError as e:
         log_critical_error("mqtt", e, f"JSON decode error for topic {msg.topic}")
@@ -1402,6 +1890,9 @@ def on_log(client, userdata, level, buf):
 
 # Load existing overrides
 device_overrides = db.load_overrides()
+with override_expiry_lock:
+    for _device_id, _override in device_overrides.items():
+        schedule_override_expiry(_device_id, _override)
 print(f"📋 Loaded {len(device_overrides)} existing overrides")
 
 # Load border router mappings from database
@@ -1424,10 +1915,10 @@ async def validate_border_router_mappings():
 
     invalid_mappings = []
 
-    for device_id, ip_addr in border_router_neighbors.items():
+    for device_id, ip_addr in list(border_router_neighbors.items()):
         try:
             # Quick CoAP ping to check if device is still reachable
-            protocol = await Context.create_client_context(transports=['udp6'])
+            protocol = await get_coap_context()
             request = Message(code=GET, uri=f"coap://[{ip_addr}]/settings")
 
             response = await asyncio.wait_for(
@@ -1447,11 +1938,6 @@ async def validate_border_router_mappings():
         except Exception as e:
             logger.warning(f"⚠️ Device {device_id} at {ip_addr} unreachable: {e}")
             invalid_mappings.append(device_id)
-        finally:
-            try:
-                await protocol.shutdown()
-            except:
-                pass
 
     # Remove invalid mappings
     if invalid_mappings:
@@ -1463,6 +1949,9 @@ async def validate_border_router_mappings():
     else:
         logger.debug("✅ All border router mappings are valid")
 
+# One neighbor per <li> on the border router's status page; captures the IPv6 address
+BORDER_ROUTER_NEIGHBOR_RE = re.compile(r'<li>([0-9a-f:]+)\s')
+
 def discover_border_router_neighbors():
     """
     Discover neighboring nodes from border router's web interface
@@ -1511,9 +2000,7 @@ def discover_border_router_neighbors():
         # Look for: <li>fd00::f6ce:3673:822d:d8c7 (parent: fd00::f6ce:365a:bb21:6e94) 1500s</li>
         # We only want the IP address part before the space
         neighbor_ips = []
-        import re
-        li_pattern = r'<li>([0-9a-f:]+)\s'
-        matches = re.findall(li_pattern, html_content)
+        matches = BORDER_ROUTER_NEIGHBOR_RE.findall(html_content)
 
         for ip in matches:
             # Skip the border router itself (fd00::f6ce:365a:bb21:6e94)
@@ -1528,7 +2015,7 @@ def discover_border_router_neighbors():
 
         for ip in neighbor_ips:
             logger.info(f"🔍 Querying device at {ip} for ID...")
-            device_id = asyncio.run(query_device_id(ip))
+            device_id = run_coap(query_device_id(ip))
             if device_id:
                 device_mapping[device_id] = ip
                 logger.info(f"🗺️ Mapped {device_id} -> {ip}")
@@ -1544,13 +2031,6 @@ def discover_border_router_neighbors():
         border_router_neighbors.update(device_mapping)
         last_neighbor_discovery = current_time
 
-        # Clean up stale mappings periodically (every hour)
-        if current_time - getattr(discover_border_router_neighbors, '_last_cleanup', 0) > 3600:
-            db.cleanup_stale_mappings()
-            # Also validate current mappings
-            asyncio.run(validate_border_router_mappings())
-            discover_border_router_neighbors._last_cleanup = current_time
-
         if new_mappings > 0:
             logger.info(f"✅ Border router discovery complete: {len(device_mapping)} devices mapped, {new_mappings} new/updated")
         else:
@@ -1562,21 +2042,73 @@ def discover_border_router_neighbors():
         logger.warning(f"❌ Border router discovery failed: {e}")
         return border_router_neighbors
 
+# Serialized responses of polled endpoints, least recently used first:
+# {(path, *parsed params): (expires_at, body, etag)}
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def ttl_cached(ttl: float, params: Tuple[Tuple[str, object, type], ...] = ()):
+    """
+    Cache a JSON view's serialized body for ttl seconds, keyed by path and the parsed
+    query parameters the view reads, given as (name, default, type) like request.args.get.
+    Other query string content doesn't create new entries, and at most
+    API_CACHE_MAX_ENTRIES responses are kept.
+    Every webapp client polling within the window gets the same bytes without a DB query,
+    and clients sending If-None-Match with the current ETag get a bodiless 304.
+    The wrapped view returns plain data rather than a jsonify() response.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.path,) + tuple(
+                request.args.get(name, default, type=type_) for name, default, type_ in params
+            )
+            now = time.monotonic()
+            with _response_cache_lock:
+                cached = _response_cache.get(key)
+                if cached is not None:
+                    _response_cache.move_to_end(key)
+            if cached is None or cached[0] <= now:
+                body = orjson.dumps(view(*args, **kwargs), default=app.json.default, option=OrjsonProvider.option)
+                cached = (now + ttl, body, hashlib.blake2b(body, digest_size=8).hexdigest())
+                with _response_cache_lock:
+                    _response_cache[key] = cached
+                    _response_cache.move_to_end(key)
+                    while len(_response_cache) > API_CACHE_MAX_ENTRIES:
+                        _response_cache.popitem(last=False)
+
+            response = Response(cached[1], mimetype='application/json')
+            response.set_etag(cached[2])
+            response.cache_control.max_age = max(1, int(ttl))
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
 # REST API Endpoints
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint for monitoring"""
     try:
-        # Check if the pool is initialized
+        # Recent successful queries prove the pool is healthy; only probe when it has been quiet
         db_status = 'disconnected'
+        pool_info = None
         if db.pool:
-            try:
-                # Try to get a connection to check pool health
-                conn = db.pool.get_connection()
+            if time.monotonic() - db.last_success <= DB_HEALTHY_WITHIN_SECONDS:
                 db_status = 'connected'
-                conn.close()
-            except mysql.connector.Error:
-                db_status = 'disconnected'
+            else:
+                try:
+                    # The pool pings (and if needed reconnects) the connection on checkout
+                    with db.connection():
+                        pass
+                    db_status = 'connected'
+                except Exception:
+                    db_status = 'disconnected'
+
+            pool_info = {
+                'size': db.pool.pool_size,
+                'idle_connections': db.pool._cnx_queue.qsize(),
+                'seconds_since_last_success': round(time.monotonic() - db.last_success, 1) if db.last_success else None
+            }
 
         health_status = {
             'status': 'healthy',
@@ -1586,6 +2118,7 @@ def health_check():
                 'ml_model': 'disabled',  # ML no longer used for LED control decisions
                 'mqtt': 'running',                'api': 'running'
             },
+            'database_pool': pool_info,
             'error_counts': critical_ops,
             'uptime_info': {
                 'active_overrides': len(device_overrides),
@@ -1595,7 +2128,7 @@ def health_check():
         }
 
         # Determine overall health
-        if critical_ops.get("db_errors", 0) > 10 or critical_ops.get("mqtt_errors", 0) > 10:
+        if critical_ops["db_errors"] > 10 or critical_ops["mqtt_errors"] > 10:
             health_status['status'] = 'degraded'
 
         if db_status == 'disconnected':
@@ -1624,44 +2157,39 @@ def get_status():
 @app.route('/api/devices', methods=['GET'])
 def get_devices():
     """Get all devices with latest data and override status"""
-    devices = {}
-
-    # Get all known devices from database (historical data)
-    all_known_devices = db.get_device_locations_from_db()
-
-    # For each known device, get the latest data if available
-    for device_id in all_known_devices.keys():
-        current_data = latest_sensor_data.get(device_id)
-        override = device_overrides.get(device_id)
-
-        devices[device_id] = {
-            'latest_data': current_data if current_data else None,
+    # Known devices from database (historical data), plus any currently active device
+    # that might not have location data yet
+    device_ids = dict.fromkeys(db.get_device_locations_from_db())
+    device_ids.update(dict.fromkeys(list(latest_sensor_data)))
+
+    devices = {
+        device_id: {
+            'latest_data': latest_sensor_data.get(device_id) or None,
             'uri': get_device_uri(device_id),
-            'override': {
-                'active': override is not None,
-                'status': override['status'] if override else None,
-                'type': override['type'] if override else None,
-                'expires_at': override['expires_at'].isoformat() if override and override.get('expires_at') else None
-            } if override else {'active': False}
+            'override': _override_view(device_overrides.get(device_id))
         }
-
-    # Also include any devices that are currently active but might not have location data
-    for device_id, data in latest_sensor_data.items():
-        if device_id not in devices:
-            override = device_overrides.get(device_id)
-            devices[device_id] = {
-                'latest_data': data,
-                'uri': get_device_uri(device_id),
-                'override': {
-                    'active': override is not None,
-                    'status': override['status'] if override else None,
-                    'type': override['type'] if override else None,
-                    'expires_at': override['expires_at'].isoformat() if override and override.get('expires_at') else None
-                } if override else {'active': False}
-            }
+        for device_id in device_ids
+    }
 
     return jsonify(devices)
 
+_INACTIVE_OVERRIDE_VIEW = {'active': False}
+
+def _override_view(override: Optional[dict]) -> dict:
+    """API representation of a device override; views are shared between devices and requests"""
+    if override is None:
+        return _INACTIVE_OVERRIDE_VIEW
+    return _active_override_view(override['status'], override['type'], override['expires_at'])
+
+@functools.lru_cache(maxsize=256)
+def _active_override_view(status: str, override_type: str, expires_at: Optional[datetime]) -> dict:
+    return {
+        'active': True,
+        'status': status,
+        'type': override_type,
+        'expires_at': expires_at.isoformat() if expires_at else None
+    }
+
 @app.route('/api/device-locations', methods=['GET'])
 def get_device_locations():
     """Get device-to-location mapping for all known devices"""
@@ -1669,7 +2197,7 @@ def get_device_locations():
     locations = db.get_device_locations_from_db()
 
     # Then merge/override with current locations from active nodes
-    for device_id, data in latest_sensor_data.items():
+    for device_id, data in list(latest_sensor_data.items()):
         location = data.get('location')
         if location:
             locations[device_id] = location
@@ -1693,13 +2221,14 @@ def set_override(device_id):
         return jsonify({'error': 'Type must be "1h", "4h", "12h", "24h", "permanent", or "disabled"'}), 400
 
     set_device_override(device_id, status, override_type)
+    override = device_overrides.get(device_id)
 
     return jsonify({
         'success': True,
         'device_id': device_id,
         'status': status,
         'type': override_type,
-        'expires_at': device_overrides[device_id]['expires_at'].isoformat() if device_id in device_overrides and device_overrides[device_id].get('expires_at') else None
+        'expires_at': override['expires_at'].isoformat() if override and override.get('expires_at') else None
     })
 
 @app.route('/api/devices/<device_id>/override', methods=['DELETE'])
@@ -1733,7 +2262,7 @@ def set_led_control(device_id):
         if override_type == "permanent":
             coap_payload = coap_payload[:-1] + ', "od": 1576800000}'  # ~50 years
 
-        asyncio.run(send_coap_request(uri, coap_payload))
+        run_coap(send_coap_request(uri, coap_payload))
         logger.info(f"💡 LED control: {device_id} LED {status.upper()} ({override_type})")
 
     return jsonify({
@@ -1769,7 +2298,7 @@ def set_heating_control(device_id):
         if override_type == "permanent":
             coap_payload = coap_payload[:-1] + ', "od": 1576800000}'  # ~50 years
 
-        asyncio.run(send_coap_request(uri, coap_payload))
+        run_coap(send_coap_request(uri, coap_payload))
         logger.info(f"🔥 Heating control: {device_id} HEATING {status.upper()} ({override_type})")
 
     return jsonify({
@@ -1781,6 +2310,7 @@ def set_heating_control(device_id):
     })
 
 @app.route('/api/sensor-data', methods=['GET'])
+@ttl_cached(API_CACHE_TTL, params=(('hours', 24, int),))
 def get_sensor_data():
     """Get recent sensor data"""
     hours = request.args.get('hours', 24, type=int)
@@ -1808,7 +2338,7 @@ def get_sensor_data():
         data_by_device[device_id].append(entry)
 
     # Add/merge current data from active nodes
-    for device_id, current_data in latest_sensor_data.items():
+    for device_id, current_data in list(latest_sensor_data.items()):
         # Create an entry for current data
         timestamp = current_data.get('timestamp', datetime.now().isoformat())
         if isinstance(timestamp, datetime):
@@ -1836,12 +2366,20 @@ def get_sensor_data():
     # Sort by timestamp string (ISO format is lexicographically sortable)
     all_data.sort(key=lambda x: x['timestamp'], reverse=True)
 
-    return jsonify(all_data)
+    return all_data
+
+@app.route('/api/sensor-stats', methods=['GET'])
+def get_sensor_stats():
+    """Get per-device sensor aggregates without transferring raw readings"""
+    hours = request.args.get('hours', 24, type=int)
+
+    return jsonify(db.get_recent_stats(hours))
 
 @app.route('/api/energy-stats', methods=['GET'])
+@ttl_cached(API_CACHE_TTL)
 def get_energy_stats():
     """Get energy optimization statistics"""
-    return jsonify(db.get_energy_stats())
+    return db.get_energy_stats()
 
 @app.route('/api/baseline-comparison', methods=['GET'])
 def get_baseline_comparison():
@@ -1867,7 +2405,8 @@ def get_baseline_comparison():
 def get_model_info():
     """Get ML model information and capabilities"""
     model_info = {
-        'model_loaded': trained_model is not None,
+        # Reported without loading: the model is only loaded by the ML decision path, never by a request
+        'model_loaded': _ml_model is not None,
         'model_type': 'disabled',  # ML no longer used for LED control decisions
         'decision_method': 'manual_only',  # Only manual overrides control LEDs
         'energy_efficiency': 'N/A',  # No automatic energy optimization
@@ -1899,8 +2438,7 @@ def refresh_system():
 
     # Publish system refresh command
     try:
-        publish.single("system/commands", json.dumps({"command": "status_refresh"}),
-                      hostname=MQTT_BROKER, port=MQTT_PORT)
+        mqtt_publish("system/commands", orjson.dumps({"command": "status_refresh"}))
     except Exception as e:
         print(f"❌ Failed to publish refresh command: {e}")
 
@@ -1925,8 +2463,7 @@ def global_device_control():
     try:
         # Publish global command for virtual nodes
         global_topic = "devices/all/control"
-        publish.single(global_topic, json.dumps({"command": command}),
-                      hostname=MQTT_BROKER, port=MQTT_PORT)
+        mqtt_publish(global_topic, orjson.dumps({"command": command}))
 
         # Also send global command for physical nodes via serial bridge
         logger.info(f"🌐 Sending global command {command} to all devices")
@@ -1980,7 +2517,7 @@ def global_led_control():
             if uri:
                 led_value = 1 if status == "on" else 0
                 coap_payload = f'{{"mo": 1, "ls": {led_value}}}'
-                asyncio.run(send_coap_request(uri, coap_payload))
+                run_coap(send_coap_request(uri, coap_payload))
 
         logger.info(f"💡 Global LED control: All devices LED {status.upper()}")
 
@@ -2002,7 +2539,7 @@ def global_led_auto():
             uri = get_device_uri(device_id)
             if uri:
                 coap_payload = '{"mo": 0, "ab": 1}'  # Disable manual override, enable auto
-                asyncio.run(send_coap_request(uri, coap_payload))
+                run_coap(send_coap_request(uri, coap_payload))
 
         logger.info(f"🤖 Global LED auto mode: All devices")
 
@@ -2036,7 +2573,7 @@ def global_heating_control():
             if uri:
                 heating_value = 1 if status == "on" else 0
                 coap_payload = f'{{"mo": 1, "hs": {heating_value}}}'
-                asyncio.run(send_coap_request(uri, coap_payload))
+                run_coap(send_coap_request(uri, coap_payload))
 
         logger.info(f"🔥 Global heating control: All devices HEATING {status.upper()}")
 
@@ -2058,7 +2595,7 @@ def global_heating_auto():
             uri = get_device_uri(device_id)
             if uri:
                 coap_payload = '{"mo": 0, "ab": 1}'  # Disable manual override, enable auto
-                asyncio.run(send_coap_request(uri, coap_payload))
+                run_coap(send_coap_request(uri, coap_payload))
 
         logger.info(f"🤖 Global heating auto mode: All devices")
 
@@ -2075,30 +2612,19 @@ def clear_historical_data():
     """Clear all historical sensor data from the database and reset statistics"""
     try:
         deleted_count = 0
-        conn = db.get_connection()
-        cursor = conn.cursor()
-
-        # Count records before deletion
-        cursor.execute("SELECT COUNT(*) FROM sensor_data")
-        count_result = cursor.fetchone()
-        deleted_count = count_result[0] if count_result else 0
-
-        # Delete all historical sensor data
-        cursor.execute("DELETE FROM sensor_data")
-
-        # Reset energy statistics to zero
-        cursor.execute("""
-            UPDATE energy_stats
-            SET total_decisions = 0,
-                energy_saved = 0.000,
-                ambient_overrides = 0,
-                optimization_events = 0,
-                baseline_energy = 0.000,
-                ml_energy = 0.000
-            WHERE id = 1
-        """)
-
-        conn.commit()
+        with db.connection() as conn, conn.cursor() as cursor:
+            # Count records before deletion
+            cursor.execute("SELECT COUNT(*) FROM sensor_data")
+            count_result = cursor.fetchone()
+            deleted_count = count_result[0] if count_result else 0
+
+            # Delete all historical sensor data
+            cursor.execute("DELETE FROM sensor_data")
+
+            conn.commit()
+
+        # Reset energy statistics to zero (database row and in-memory snapshot)
+        db.reset_energy_stats()
 
         # Clear in-memory cache
         global latest_sensor_data
@@ -2108,9 +2634,6 @@ def clear_historical_data():
         print(f"🔄 Reset energy statistics to zero")
         print(f"💾 Cleared in-memory sensor data cache")
 
-        cursor.close()
-        conn.close()
-
         return jsonify({
             'success': True,
             'deleted_records': deleted_count,
@@ -2142,24 +2665,14 @@ def force_clock_sync():
 
         logger.info(f"🕐 Manual clock sync triggered for {len(devices)} device(s)")
 
-        # Synchronize each device
-        for device_id in devices:
-            try:
-                # Run async sync in event loop
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                success = loop.run_until_complete(sync_device_clock(device_id))
-                loop.close()
-
-                if success:
-                    synced_devices.append(device_id)
-                    logger.info(f"✅ Successfully synced {device_id}")
-                else:
-                    failed_devices.append(device_id)
-                    logger.warning(f"⚠️ Failed to sync {device_id}")
-            except Exception as e:
+        # Synchronize all devices concurrently
+        for device_id, success in run_coap(sync_all_devices(devices)).items():
+            if success:
+                synced_devices.append(device_id)
+                logger.info(f"✅ Successfully synced {device_id}")
+            else:
                 failed_devices.append(device_id)
-                logger.error(f"❌ Error syncing {device_id}: {e}")
+                logger.warning(f"⚠️ Failed to sync {device_id}")
 
         # Return results
         if len(synced_devices) > 0:
@@ -2220,6 +2733,8 @@ def update_device_schedule(device_id):
         # Save schedule to database FIRST (persistence)
         db.save_device_schedule(device_id, schedule)
         logger.info(f"💾 Schedule saved to database for {device_id}")
+        # Fallback: the broadcaster retries unless the direct send below succeeds
+        schedule_broadcast_at(device_id, SCHEDULE_BROADCAST_RETRY)
 
         # Get device URI
         uri = get_device_uri(device_id)
@@ -2242,12 +2757,12 @@ def update_device_schedule(device_id):
         optimized_schedule = [int(temp) if temp == int(temp) else temp for temp in schedule]
 
         # Send CoAP PUT request with schedule (compact JSON, no spaces)
-        coap_payload = json.dumps({'schedule': optimized_schedule}, separators=(',', ':'))
+        coap_payload = orjson.dumps({'schedule': optimized_schedule}).decode()
 
         logger.info(f"📦 Payload size: {len(coap_payload)} bytes (optimized)")
 
         try:
-            response = asyncio.run(send_coap_request(schedule_uri, coap_payload))
+            response = run_coap(send_coap_request(schedule_uri, coap_payload))
 
             if response is None:
                 logger.error(f"❌ Failed to send schedule to {device_id} - No CoAP response")
@@ -2260,6 +2775,7 @@ def update_device_schedule(device_id):
 
             # Update last_broadcast timestamp in database
             db.update_schedule_broadcast_time(device_id)
+            schedule_broadcast_at(device_id, SCHEDULE_BROADCAST_INTERVAL)
 
             return jsonify({
                 'success': True,
@@ -2310,16 +2826,14 @@ def control_heating(device_id):
 def get_all_schedules():
     """Get all saved temperature schedules"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(dictionary=True)
+        with db.connection() as conn, conn.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT id, name, description, created_at, updated_at
+                FROM temperature_schedules
+                ORDER BY created_at DESC
+            """)
 
-        cursor.execute("""
-            SELECT id, name, description, created_at, updated_at
-            FROM temperature_schedules
-            ORDER BY created_at DESC
-        """)
-
-        schedules = cursor.fetchall()
+            schedules = cursor.fetchall()
 
         return jsonify({
             'success': True,
@@ -2328,29 +2842,25 @@ def get_all_schedules():
     except Exception as e:
         logger.error(f"❌ Failed to fetch schedules: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/history/<device_id>', methods=['GET'])
 def get_historical_data(device_id):
     """Get last 48 temperature readings (24 hours at 30-min intervals) for device initialization"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        # Get last 48 temperature readings from sensor_data
-        # Assuming data is stored every 15 seconds, we want readings from last 24 hours
-        # For 30-min intervals, we need readings at 0, 30, 60, 90 minutes, etc.
-        cursor.execute("""
-            SELECT payload, timestamp
-            FROM sensor_data
-            WHERE device_id = %s
-            AND timestamp >= NOW() - INTERVAL 24 HOUR
-            ORDER BY timestamp DESC
-        """, (device_id,))
-
-        all_data = cursor.fetchall()
+        # The connection goes back to the pool as soon as the rows are fetched
+        with db.connection() as conn, conn.cursor(dictionary=True) as cursor:
+            # Get last 48 temperature readings from sensor_data
+            # Assuming data is stored every 15 seconds, we want readings from last 24 hours
+            # For 30-min intervals, we need readings at 0, 30, 60, 90 minutes, etc.
+            cursor.execute("""
+                SELECT payload, timestamp
+                FROM sensor_data
+                WHERE device_id = %s
+                AND timestamp >= NOW() - INTERVAL 24 HOUR
+                ORDER BY timestamp DESC
+            """, (device_id,))
+
+            all_data = cursor.fetchall()
 
         # Extract temperatures and sample every 30 minutes (roughly)
         temperatures = []
@@ -2391,7 +2901,7 @@ def get_historical_data(device_id):
             "count": len([t for t in temperatures if t != 20])  # Count non-default values
         }
 
-        logger.info(f"⏰ Historical data request for {device_id}: {response['count']}/48 real readings")
+        logger.info("Historical data request for %s: %d/48 real readings", device_id, response['count'])
 
         return jsonify(response)
 
@@ -2406,24 +2916,19 @@ def get_historical_data(device_id):
             "minute": now.minute,
             "count": 0
         })
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
 @app.route('/api/schedules/<int:schedule_id>', methods=['GET'])
 def get_schedule_by_id(schedule_id):
     """Get specific schedule by ID"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(dictionary=True)
+        with db.connection() as conn, conn.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT id, name, description, schedule_data, created_at, updated_at
+                FROM temperature_schedules
+                WHERE id = %s
+            """, (schedule_id,))
 
-        cursor.execute("""
-            SELECT id, name, description, schedule_data, created_at, updated_at
-            FROM temperature_schedules
-            WHERE id = %s
-        """, (schedule_id,))
-
-        schedule = cursor.fetchone()
+            schedule = cursor.fetchone()
 
         if not schedule:
             return jsonify({'success': False, 'error': 'Schedule not found'}), 404
@@ -2438,9 +2943,6 @@ def get_schedule_by_id(schedule_id):
     except Exception as e:
         logger.error(f"❌ Failed to fetch schedule {schedule_id}: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/schedules', methods=['POST'])
 def create_schedule():
@@ -2462,15 +2964,13 @@ def create_schedule():
                 'error': 'Schedule must contain exactly 168 values (7 days * 24 hours)'
             }), 400
 
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO temperature_schedules (name, description, schedule_data)
+                VALUES (%s, %s, %s)
+            """, (name, description, json.dumps(schedule)))
 
-        cursor.execute("""
-            INSERT INTO temperature_schedules (name, description, schedule_data)
-            VALUES (%s, %s, %s)
-        """, (name, description, json.dumps(schedule)))
-
-        schedule_id = cursor.lastrowid
+            schedule_id = cursor.lastrowid
 
         logger.info(f"💾 Created new schedule: {name} (ID: {schedule_id})")
 
@@ -2482,23 +2982,19 @@ def create_schedule():
     except Exception as e:
         logger.error(f"❌ Failed to create schedule: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/schedules/<int:schedule_id>', methods=['DELETE'])
 def delete_schedule(schedule_id):
     """Delete temperature schedule"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            DELETE FROM temperature_schedules
-            WHERE id = %s
-        """, (schedule_id,))
-
-        if cursor.rowcount == 0:
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM temperature_schedules
+                WHERE id = %s
+            """, (schedule_id,))
+            deleted = cursor.rowcount
+
+        if deleted == 0:
             return jsonify({'success': False, 'error': 'Schedule not found'}), 404
 
         logger.info(f"🗑️ Deleted schedule ID: {schedule_id}")
@@ -2510,13 +3006,18 @@ def delete_schedule(schedule_id):
     except Exception as e:
         logger.error(f"❌ Failed to delete schedule {schedule_id}: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 def periodic_border_router_discovery():
     """Background thread to periodically discover border router neighbors"""
     logger.info("🌐 Starting periodic border router discovery thread...")
+    # Initial discovery runs here rather than in start_background_services, so a slow
+    # border router or dead neighbours can't hold up startup (or gunicorn's worker boot)
+    logger.info("🔍 Performing initial border router discovery...")
+    try:
+        discover_border_router_neighbors()
+    except Exception as e:
+        log_critical_error("discovery", e, "Initial border router discovery failed")
+
     while True:
         try:
             # Discover neighbors every 5 minutes
@@ -2527,20 +3028,78 @@ def periodic_border_router_discovery():
             log_critical_error("discovery", e, "Periodic border router discovery failed")
             time.sleep(10)  # Wait 10 seconds before retrying on error
 
+def schedule_broadcast_at(device_id: str, delay: float = 0.0):
+    """(Re)schedule the next schedule broadcast to a device, delay seconds from now"""
+    due_at = time.monotonic() + delay
+    with schedule_broadcast_lock:
+        schedule_broadcast_due[device_id] = due_at
+        heapq.heappush(schedule_broadcast_heap, (due_at, device_id))
+
+def pop_due_schedule_broadcasts() -> List[str]:
+    """Remove and return the devices whose schedule broadcast is due"""
+    now = time.monotonic()
+    due = []
+    with schedule_broadcast_lock:
+        while schedule_broadcast_heap and schedule_broadcast_heap[0][0] <= now:
+            due_at, device_id = heapq.heappop(schedule_broadcast_heap)
+            if schedule_broadcast_due.get(device_id) == due_at:
+                del schedule_broadcast_due[device_id]
+                due.append(device_id)
+    return due
+
+def periodic_mapping_cleanup():
+    """Background thread that hourly purges stale border router mappings and re-validates the rest"""
+    while True:
+        # First pass runs at startup, so mappings that went stale while the controller was down go now
+        try:
+            db.cleanup_stale_mappings()
+            run_coap(validate_border_router_mappings())
+        except Exception as e:
+            log_critical_error("discovery", e, "Border router mapping cleanup failed")
+        time.sleep(MAPPING_CLEANUP_INTERVAL)
+
+def seed_schedule_broadcasts() -> bool:
+    """
+    Schedule a broadcast for every stored schedule that isn't already in the broadcast heap,
+    due when its last broadcast is SCHEDULE_BROADCAST_INTERVAL old. Returns False if the
+    database could not be read.
+    """
+    ages = db.get_schedule_broadcast_ages()
+    if ages is None:
+        return False
+
+    with schedule_broadcast_lock:
+        known = set(schedule_broadcast_due)
+    for device_id, age in ages:
+        if device_id in known:
+            continue
+        if age is None:
+            schedule_broadcast_at(device_id)  # Never broadcast: due now
+        else:
+            schedule_broadcast_at(device_id, max(0, SCHEDULE_BROADCAST_INTERVAL - age))
+    return True
+
 def periodic_schedule_broadcast():
     """Background thread that broadcasts schedules to devices on first contact and periodically (every 5 minutes)"""
     logger.info("📅 Starting periodic schedule broadcast thread...")
-    BROADCAST_INTERVAL = 300  # 5 minutes in seconds
 
     # Wait initial 20 seconds for system to stabilize
     time.sleep(20)
 
+    # The heap is maintained in memory; MySQL is only read to seed it, retried until it
+    # succeeds and then repeated now and then to pick up schedules the heap doesn't know about
+    next_seed = 0.0
+
     while True:
         try:
-            time.sleep(60)  # Check every minute for new devices, broadcast every 5 minutes
+            if time.monotonic() >= next_seed:
+                seeded = seed_schedule_broadcasts()
+                next_seed = time.monotonic() + (SCHEDULE_BROADCAST_RESEED_INTERVAL if seeded else SCHEDULE_BROADCAST_RETRY)
+
+            time.sleep(SCHEDULE_BROADCAST_TICK)
 
-            # Get devices that need schedule broadcast (first time or periodic refresh)
-            devices_needing_broadcast = db.get_devices_needing_schedule_broadcast(BROADCAST_INTERVAL)
+            # Devices whose broadcast is due (first time, periodic refresh or retry)
+            devices_needing_broadcast = pop_due_schedule_broadcasts()
 
             if devices_needing_broadcast:
                 logger.info("\n" + "="*60)
@@ -2548,17 +3107,20 @@ def periodic_schedule_broadcast():
                 logger.info("="*60)
                 logger.info(f"  Devices needing schedule broadcast: {devices_needing_broadcast}")
 
+                broadcast_ok = []
                 for device_id in devices_needing_broadcast:
                     # Check if device is reachable
                     uri = get_device_uri(device_id)
                     if not uri:
                         logger.warning(f"  ⚠️ {device_id}: Device URI not found (offline?)")
+                        schedule_broadcast_at(device_id, SCHEDULE_BROADCAST_RETRY)
                         continue
 
                     # Load schedule from database
                     schedule = db.load_device_schedule(device_id)
                     if not schedule:
                         logger.warning(f"  ⚠️ {device_id}: No schedule found in database")
+                        schedule_broadcast_at(device_id, SCHEDULE_BROADCAST_RETRY)
                         continue
 
                     # Broadcast schedule to device
@@ -2567,20 +3129,25 @@ def periodic_schedule_broadcast():
 
                     # Optimize schedule data
                     optimized_schedule = [int(temp) if temp == int(temp) else temp for temp in schedule]
-                    coap_payload = json.dumps({'schedule': optimized_schedule}, separators=(',', ':'))
+                    coap_payload = orjson.dumps({'schedule': optimized_schedule}).decode()
 
                     try:
-                        response = asyncio.run(send_coap_request(schedule_uri, coap_payload))
+                        response = run_coap(send_coap_request(schedule_uri, coap_payload))
                         if response is not None:
                             logger.info(f"  ✅ {device_id}: Schedule broadcast successful")
-                            db.update_schedule_broadcast_time(device_id)
+                            broadcast_ok.append(device_id)
+                            schedule_broadcast_at(device_id, SCHEDULE_BROADCAST_INTERVAL)
                         else:
                             logger.error(f"  ❌ {device_id}: Schedule broadcast failed (no response)")
+                            schedule_broadcast_at(device_id, SCHEDULE_BROADCAST_RETRY)
                     except Exception as coap_error:
                         logger.error(f"  ❌ {device_id}: Schedule broadcast error: {coap_error}")
+                        schedule_broadcast_at(device_id, SCHEDULE_BROADCAST_RETRY)
 
                     time.sleep(0.5)  # Small delay between devices
 
+                # One UPDATE for every device that acknowledged its schedule
+                db.update_schedule_broadcast_times(broadcast_ok)
                 logger.info("="*60 + "\n")
 
         except Exception as e:
@@ -2608,18 +3175,13 @@ def periodic_time_sync_broadcast():
             if not all_device_ids:
                 logger.debug("⏰ No devices to sync - will retry in 1 hour")
             else:
-                logger.info(f"⏰ Syncing {len(all_device_ids)} devices: {', '.join(all_device_ids)}")
+                logger.info("⏰ Syncing %d devices: %s", len(all_device_ids), ', '.join(all_device_ids))
 
-                # Sync each device
-                for device_id in all_device_ids:
-                    try:
-                        asyncio.run(sync_device_clock(device_id))
-                        # Small delay between devices to avoid flooding
-                        time.sleep(1)
-                    except Exception as e:
-                        logger.error(f"⏰ Failed to sync {device_id}: {e}")
+                # Sync all devices concurrently (bounded by COAP_FANOUT_LIMIT)
+                results = run_coap(sync_all_devices(all_device_ids))
 
-                logger.info(f"✅ Time sync broadcast complete for {len(all_device_ids)} devices")
+                logger.info("✅ Time sync broadcast complete: %d/%d devices synced",
+                            sum(results.values()), len(all_device_ids))
 
             # Wait 30 seconds before next broadcast
             time.sleep(30)
@@ -2628,120 +3190,150 @@ def periodic_time_sync_broadcast():
             log_critical_error("time_sync", e, "Periodic time sync broadcast failed")
             time.sleep(60)  # Wait 1 minute before retrying on error
 
-def start_mqtt_client():
-    """Start MQTT client in separate thread with automatic reconnection"""
-    logger.info("📡 Starting MQTT client...")
-
-    def create_mqtt_client():
-        """Create and configure MQTT client"""
-        client = mqtt.Client(client_id="iot_controller")
-        client.on_connect = on_connect
-        client.on_message = on_message
-        client.on_disconnect = on_disconnect
-        client.on_log = on_log
-
-        # Configure MQTT client settings for better reliability
-        client.reconnect_delay_set(min_delay=1, max_delay=120)
-        client.max_inflight_messages_set(20)
-        client.max_queued_messages_set(100)
-
-        return client
+# The long-lived client from start_mqtt_client, shared for publishing (None until created)
+mqtt_client = None
 
-    retry_count = 0
-    max_retries = 5
-
-    while retry_count < max_retries:
-        try:
-            client = create_mqtt_client()
-            logger.info(f"📡 Connecting to MQTT broker {MQTT_BROKER}:{MQTT_PORT} (attempt {retry_count + 1})")
+def mqtt_publish(topic: str, payload):
+    """Publish over the controller's persistent MQTT connection (thread-safe in paho)"""
+    client = mqtt_client
+    if client is None or not client.is_connected():
+        raise RuntimeError("MQTT client is not connected")
 
-            client.connect(MQTT_BROKER, MQTT_PORT, 60)
-            logger.info("📡 MQTT client connected successfully")
+    info = client.publish(topic, payload, qos=0)
+    if info.rc != mqtt.MQTT_ERR_SUCCESS:
+        raise RuntimeError(f"MQTT publish to {topic} failed: {mqtt.error_string(info.rc)}")
 
-            # Start the loop - this will handle reconnections automatically
-            client.loop_forever()
+def start_mqtt_client():
+    """
+    Connect the MQTT client and run paho's network loop on its own thread.
+    paho retries the first connection and reconnects after drops by itself,
+    backing off per reconnect_delay_set, until disconnect() is called.
+    """
+    global mqtt_client
+    logger.info("📡 Starting MQTT client...")
 
-        except ConnectionRefusedError as e:
-            retry_count += 1
-            log_critical_error("mqtt", e, f"MQTT connection refused (attempt {retry_count})")
-            if retry_count < max_retries:
-                logger.info(f"⏳ Retrying MQTT connection in 5 seconds...")
-                time.sleep(5)
-            else:
-                logger.error("💥 MQTT connection failed after multiple retries. Exiting MQTT thread.")
-                break # Exit loop
+    # Unique per process, so several serving workers don't kick each other off the broker
+    client = mqtt.Client(client_id=f"iot_controller-{os.getpid()}")
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.on_disconnect = on_disconnect
+    client.on_log = on_log
+
+    # Configure MQTT client settings for better reliability
+    client.reconnect_delay_set(min_delay=1, max_delay=120)
+    # Absorb bursts from the whole sensor fleet; on_message only queues DB writes,
+    # so it never holds up paho's network loop waiting on MySQL
+    client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
+    client.max_queued_messages_set(MQTT_MAX_QUEUED)
+
+    mqtt_client = client
+    logger.info("📡 Connecting to MQTT broker %s:%s", MQTT_BROKER, MQTT_PORT)
+    try:
+        # The connection is made on the loop thread, so a broker that is still starting doesn't fail here
+        client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+        client.loop_start()
+    except Exception as e:
+        log_critical_error("mqtt", e, "Failed to start MQTT network loop")
 
-        except Exception as e:
-            retry_count += 1
-            log_critical_error("mqtt", e, f"MQTT client error (attempt {retry_count})")
-            if retry_count < max_retries:
-                logger.info(f"⏳ Retrying MQTT connection in 5 seconds...")
-                time.sleep(5)
-            else:
-                logger.error("💥 MQTT client error after multiple retries. Exiting MQTT thread.")
-                break # Exit loop
+# Error bodies never change, so they are serialized once
+ERROR_404_BODY = orjson.dumps({'error': 'Endpoint not found'})
+ERROR_500_BODY = orjson.dumps({'error': 'Internal server error'})
+ERROR_UNHANDLED_BODY = orjson.dumps({'error': 'An unexpected error occurred'})
 
-# Add Flask error handlers
-@app.errorhandler(404)
+# Flask error handlers
 def not_found_error(error):
+    url = request.url
     critical_ops["api_errors"] += 1
-    logger.warning(f"🌐 API 404 error: {request.url}")
-    return jsonify({'error': 'Endpoint not found'}), 404
+    logger.warning("404 %s", url)
+    return Response(ERROR_404_BODY, status=404, mimetype='application/json')
 
-@app.errorhandler(500)
 def internal_error(error):
-    log_critical_error("api", error, f"Internal server error for {request.url}")
-    return jsonify({'error': 'Internal server error'}), 500
+    url = request.url
+    log_critical_error("api", error, "Internal server error for %s", url)
+    return Response(ERROR_500_BODY, status=500, mimetype='application/json')
+
+def http_exception(e):
+    # HTTP errors (405, 400, ...) keep their own status instead of becoming a logged 500
+    return e
 
-@app.errorhandler(Exception)
 def handle_exception(e):
-    log_critical_error("api", e, f"Unhandled exception for {request.url}")
-    return jsonify({'error': 'An unexpected error occurred'}), 500
+    url = request.url
+    log_critical_error("api", e, "Unhandled exception for %s", url)
+    return Response(ERROR_UNHANDLED_BODY, status=500, mimetype='application/json')
 
-if __name__ == "__main__":
+app.register_error_handler(404, not_found_error)
+app.register_error_handler(500, internal_error)
+app.register_error_handler(HTTPException, http_exception)
+app.register_error_handler(Exception, handle_exception)
+
+def start_background_services():
+    """
+    Start border router discovery, periodic broadcasts and the MQTT client.
+    Must run exactly once per serving process: from __main__ for local runs,
+    or from gunicorn's post_worker_init hook (see gunicorn.conf.py).
+    """
+    logger.info("🚀 IoT Energy Management Controller Starting...\n"
+                "🌐 REST API will be available on port 5001\n"
+                "📡 MQTT broker: %s:%s\n"
+                "🗄️ Database: %s/%s\n"
+                "📊 Critical operations monitoring enabled",
+                MQTT_BROKER, MQTT_PORT, MYSQL_HOST, MYSQL_DB)
+
+    # The DatabaseManager handles connection retries internally; make sure the
+    # pool actually hands out a connection that reaches the server. This also runs
+    # inside gunicorn's post_worker_init, so report and carry on rather than exit:
+    # the pool reconnects on later checkouts once MySQL is back.
     try:
-        logger.info("🚀 IoT Energy Management Controller Starting...")
-        logger.info(f"🌐 REST API will be available on port 5001")
-        logger.info(f"📡 MQTT broker: {MQTT_BROKER}:{MQTT_PORT}")
-        logger.info(f"🗄️ Database: {MYSQL_HOST}/{MYSQL_DB}")
-        logger.info(f"📊 Critical operations monitoring enabled")
-
-        # The DatabaseManager now handles connection retries internally.
-        # We just need to check if the pool was successfully created.
-        if not db.pool:
-            logger.error("💥 STARTUP FAILED: Database connection pool unavailable.")
-            sys.exit(1)
-
-        # Do initial border router discovery
-        logger.info("🔍 Performing initial border router discovery...")
-        discover_border_router_neighbors()
+        with db.connection() as conn:
+            conn.ping(reconnect=False)
+    except Exception as e:
+        log_critical_error("db", e, "Startup database ping failed")
+        logger.error("💥 Database connection pool unavailable at startup - continuing, writes retry on reconnect")
+
+    # Start border router discovery (initial and periodic) in background thread
+    logger.info("🌐 Starting periodic border router discovery thread...")
+    discovery_thread = threading.Thread(target=periodic_border_router_discovery, daemon=True)
+    discovery_thread.start()
+
+    # Purge stale border router mappings hourly in background thread
+    logger.info("🧹 Starting border router mapping cleanup thread...")
+    mapping_cleanup_thread = threading.Thread(target=periodic_mapping_cleanup, daemon=True)
+    mapping_cleanup_thread.start()
+
+    # Start periodic time sync broadcast in background thread
+    logger.info("⏰ Starting periodic time sync broadcast thread...")
+    time_sync_thread = threading.Thread(target=periodic_time_sync_broadcast, daemon=True)
+    time_sync_thread.start()
 
-        # Start periodic border router discovery in background thread
-        logger.info("🌐 Starting periodic border router discovery thread...")
-        discovery_thread = threading.Thread(target=periodic_border_router_discovery, daemon=True)
-        discovery_thread.start()
+    # Start periodic schedule broadcast in background thread
+    logger.info("📅 Starting periodic schedule broadcast thread...")
+    schedule_broadcast_thread = threading.Thread(target=periodic_schedule_broadcast, daemon=True)
+    schedule_broadcast_thread.start()
 
-        # Start periodic time sync broadcast in background thread
-        logger.info("⏰ Starting periodic time sync broadcast thread...")
-        time_sync_thread = threading.Thread(target=periodic_time_sync_broadcast, daemon=True)
-        time_sync_thread.start()
+    # Start override expiry sweep in background thread
+    logger.info("⏱️ Starting override expiry sweep thread...")
+    override_sweep_thread = threading.Thread(target=periodic_override_sweep, daemon=True)
+    override_sweep_thread.start()
 
-        # Start periodic schedule broadcast in background thread
-        logger.info("📅 Starting periodic schedule broadcast thread...")
-        schedule_broadcast_thread = threading.Thread(target=periodic_schedule_broadcast, daemon=True)
-        schedule_broadcast_thread.start()
+    # Start MQTT client; paho runs its network loop in its own background thread
+    start_mqtt_client()
 
-        # Start MQTT client in background thread
-        logger.info("📡 Starting MQTT client thread...")
-        mqtt_thread = threading.Thread(target=start_mqtt_client, daemon=True)
-        mqtt_thread.start()
+    # Wait for the broker's CONNACK instead of a fixed delay; paho keeps
+    # retrying on its own, so a slow broker doesn't stop the REST API from serving
+    if not mqtt_ready.wait(timeout=10):
+        logger.error("❌ MQTT did not connect within 10s - continuing, client keeps retrying")
 
-        # Give MQTT client time to connect
-        time.sleep(2)
+if __name__ == "__main__":
+    # Under gunicorn the worker installs its own handlers and calls shutdown_background_services on exit
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    try:
+        start_background_services()
 
-        # Start Flask REST API with error handling
+        # Local development server; the container runs the app under gunicorn
         logger.info("🌐 Starting Flask REST API server...")
-        app.run(host='0.0.0.0', port=5001, debug=False, use_reloader=False, threaded=True)
+        app.run(host='0.0.0.0', port=5001, use_reloader=False, threaded=True)
 
     except KeyboardInterrupt:
         logger.info("⏹️ Received keyboard interrupt, shutting down...")
@@ -2749,5 +3341,7 @@ if __name__ == "__main__":
         log_critical_error("startup", e, "Critical startup failure")
         sys.exit(1)
     finally:
+        # Flush queued writes and disconnect, whichever way the server stopped
+        shutdown_background_services()
         logger.info("🔄 Controller shutdown complete")
-        logger.info(f"📊 Final error counts: {critical_ops}")
\ No newline at end of file
+        logger.info("📊 Final error counts: %s", critical_ops)
\ No newline at end of file
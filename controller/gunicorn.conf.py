@@ -0,0 +1,36 @@
+"""
+Gunicorn configuration for the IoT controller.
+
+A single worker keeps device overrides, latest sensor data and the MQTT
+client in one process; concurrency for the REST API comes from threads.
+The app is imported inside the worker (no preload), so the database pool
+and writer threads are created after the fork, and the MQTT/broadcast
+threads are started once the worker has loaded the app.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('CONTROLLER_PORT', 5001)}"
+worker_class = "gthread"
+# Overrides, latest readings, the broadcast heaps and caches live in process memory and
+# every worker runs its own MQTT client (storing every reading again), so this must stay 1
+workers = 1
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = 120
+graceful_timeout = 30
+preload_app = False
+
+accesslog = None  # Per-request logging stays off, as with the Flask server
+errorlog = "-"
+loglevel = "warning"
+
+
+def post_worker_init(worker):
+    """Start MQTT, discovery and broadcast threads inside the serving worker"""
+    import controller
+    controller.start_background_services()
+
+
+def worker_exit(server, worker):
+    """Flush queued sensor readings before the worker goes away"""
+    import controller
+    controller.shutdown_background_services()
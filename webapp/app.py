@@ -15,9 +15,10 @@ Features:
 """
 
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit
 import requests
-import json
+import orjson
 import time
 from datetime import datetime
 import logging
@@ -30,7 +31,26 @@ from aiocoap.numbers import PUT
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify() via orjson; types orjson doesn't know fall back to Flask's encoder"""
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option),
+            mimetype=self.mimetype
+        )
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = 'iot_webapp_secret_key_2024'
 socketio = SocketIO(app, async_mode='threading', cors_allowed_origins="*")
 
@@ -69,9 +89,9 @@ def call_controller_api(endpoint, method='GET', data=None):
         else:
             raise ValueError(f"Unsupported method: {method}")
 
-        return response.json() if response.content else {}
+        return orjson.loads(response.content) if response.content else {}
 
-    except requests.exceptions.RequestException:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError):
         # Fallback to localhost (development mode)
         try:
             url = f"{CONTROLLER_API_LOCAL}/{endpoint}"
@@ -83,7 +103,7 @@ def call_controller_api(endpoint, method='GET', data=None):
             elif method == 'DELETE':
                 response = requests.delete(url, timeout=5)
 
-            return response.json() if response.content else {}
+            return orjson.loads(response.content) if response.content else {}
 
         except Exception as e:
             logger.error(f"Controller API call failed: {e}")
@@ -688,7 +708,7 @@ def realtime_updates():
             print(f"DEBUG: graph_data current_devices: {list(graph_data['current_devices'].keys())}")
 
             # Check if the data has changed before emitting
-            current_data_json = json.dumps(graph_data, sort_keys=True)
+            current_data_json = orjson.dumps(graph_data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
             if last_emitted_graph_data != current_data_json:
                 # Emit graph-only update with minimal data to prevent button/control interference
                 socketio.emit('graph_only_update', graph_data)